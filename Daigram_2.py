@@ -1,14 +1,21 @@
 import streamlit as st
 import streamlit.components.v1 as components
 import re
-import html
 import base64
 import json
 import graphviz
-import requests
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-import hashlib
+import os
+
+from diagram_cache import DiskCache
+from diagram_export import load_from_json, pack_svgs, render_hierarchical
+from diagram_layout import DEFAULT_BUDGET_SECONDS
+from diagram_parser import format_diagnostic
+from diagram_pipeline import DiagramPipeline
+from diagram_render import LayoutPool, LayoutResult, LocalRenderer, make_renderer
+from diagram_themes import THEMES
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -324,449 +331,6 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# --- Enhanced Icon Logic ---
-def add_icons(label):
-    """Injects icons based on keywords to make diagrams more visual and creative."""
-    l = label.lower()
-    prefix = ""
-    if any(x in l for x in ["user", "actor", "client", "customer"]): prefix = "👤 "
-    elif any(x in l for x in ["db", "data", "sql", "store", "oracle", "database"]): prefix = "🛢️ "
-    elif any(x in l for x in ["cloud", "aws", "azure", "gcp"]): prefix = "☁️ "
-    elif any(x in l for x in ["api", "rest", "json", "endpoint", "service"]): prefix = "🔌 "
-    elif any(x in l for x in ["lock", "auth", "login", "security", "token"]): prefix = "🔒 "
-    elif any(x in l for x in ["email", "message", "notification", "alert"]): prefix = "📧 "
-    elif any(x in l for x in ["error", "fail", "404", "500", "exception"]): prefix = "⚠️ "
-    elif any(x in l for x in ["settings", "config", "setup", "configuration"]): prefix = "⚙️ "
-    elif any(x in l for x in ["file", "upload", "excel", "csv", "document"]): prefix = "📄 "
-    elif any(x in l for x in ["check", "validate", "success", "ok", "verified"]): prefix = "✅ "
-    elif any(x in l for x in ["web", "site", "dashboard", "ui", "interface"]): prefix = "🖥️ "
-    elif any(x in l for x in ["mobile", "app", "phone", "ios", "android"]): prefix = "📱 "
-    elif any(x in l for x in ["server", "host", "machine", "vm"]): prefix = "🖥️ "
-    elif any(x in l for x in ["network", "router", "switch", "gateway"]): prefix = "🌐 "
-    elif any(x in l for x in ["queue", "message", "broker", "kafka", "rabbit"]): prefix = "📬 "
-    elif any(x in l for x in ["cache", "redis", "memcached"]): prefix = "⚡ "
-    elif any(x in l for x in ["search", "elastic", "lucene"]): prefix = "🔍 "
-    elif any(x in l for x in ["payment", "transaction", "money", "billing"]): prefix = "💳 "
-    elif any(x in l for x in ["analytics", "report", "metrics", "stats"]): prefix = "📊 "
-    elif any(x in l for x in ["monitor", "log", "trace", "debug"]): prefix = "📈 "
-    elif any(x in l for x in ["deploy", "ci", "cd", "pipeline", "build"]): prefix = "🚀 "
-    elif any(x in l for x in ["test", "qa", "quality"]): prefix = "🧪 "
-    elif any(x in l for x in ["start", "begin", "init"]): prefix = "▶️ "
-    elif any(x in l for x in ["end", "finish", "complete", "done"]): prefix = "🏁 "
-    elif any(x in l for x in ["load", "balance", "distribute"]): prefix = "⚖️ "
-    elif any(x in l for x in ["sync", "replicate", "copy"]): prefix = "🔄 "
-    elif any(x in l for x in ["delete", "remove", "drop"]): prefix = "🗑️ "
-    elif any(x in l for x in ["add", "create", "insert", "new"]): prefix = "➕ "
-    elif any(x in l for x in ["update", "modify", "edit", "change"]): prefix = "✏️ "
-    elif any(x in l for x in ["read", "get", "fetch", "retrieve"]): prefix = "📖 "
-    elif any(x in l for x in ["write", "post", "put", "save"]): prefix = "✍️ "
-    
-    return f"{prefix}{label}"
-
-# --- Advanced Theming System ---
-
-THEMES = {
-    "Professional (Blue)": {
-        "bgcolor": "#ffffff",
-        "edge_color": "#555555",
-        "font": "Helvetica",
-        "default": {"shape": "box", "style": "rounded,filled", "fill": "#e6f3ff", "border": "#336699", "text": "#000000"},
-        "types": {
-            "database": {"shape": "cylinder", "fill": "#fff3cd", "border": "#856404", "text": "#000000"},
-            "api": {"shape": "component", "fill": "#d1e7dd", "border": "#0f5132", "text": "#000000"},
-            "error": {"shape": "box", "style": "filled,dashed", "fill": "#f8d7da", "border": "#842029", "text": "#000000"},
-            "ui": {"shape": "rect", "fill": "#cff4fc", "border": "#055160", "text": "#000000"},
-            "actor": {"shape": "ellipse", "fill": "#e2e3e5", "border": "#383d41", "text": "#000000"}
-        }
-    },
-    "Whiteboard Sketch": {
-        "bgcolor": "#ffffff",
-        "edge_color": "#333333",
-        "font": "Comic Sans MS",
-        "default": {"shape": "box", "style": "dashed", "fill": "#ffffff", "border": "#333333", "text": "#333333"},
-        "types": {
-            "database": {"shape": "cylinder", "fill": "#ffffff", "border": "#333333", "text": "#333333"},
-            "api": {"shape": "component", "fill": "#ffffff", "border": "#333333", "text": "#333333"},
-            "error": {"shape": "box", "style": "dotted", "fill": "#ffffff", "border": "#ff0000", "text": "#ff0000"},
-            "ui": {"shape": "rect", "fill": "#ffffff", "border": "#0000ff", "text": "#0000ff"},
-            "actor": {"shape": "ellipse", "fill": "#ffffff", "border": "#333333", "text": "#333333"}
-        }
-    },
-    "Neon Cyberpunk": {
-        "bgcolor": "#0b0f19",
-        "edge_color": "#00f3ff",
-        "font": "Courier",
-        "default": {"shape": "polygon", "style": "filled", "fill": "#1a1f2e", "border": "#00f3ff", "text": "#e0e0e0"},
-        "types": {
-            "database": {"shape": "cylinder", "fill": "#2d1b2e", "border": "#ff0055", "text": "#ff0055"},
-            "api": {"shape": "component", "fill": "#0d2b2a", "border": "#00ff99", "text": "#00ff99"},
-            "error": {"shape": "box", "style": "dashed", "fill": "#2a0e0e", "border": "#ff3333", "text": "#ff3333"},
-            "ui": {"shape": "parallelogram", "fill": "#1a2a3a", "border": "#00aaff", "text": "#00aaff"},
-            "actor": {"shape": "diamond", "fill": "#222222", "border": "#ffff00", "text": "#ffff00"}
-        }
-    },
-    "Blueprint": {
-        "bgcolor": "#1c3b70",
-        "edge_color": "#ffffff",
-        "font": "Consolas",
-        "default": {"shape": "box", "style": "filled", "fill": "#1c3b70", "border": "#ffffff", "text": "#ffffff"},
-        "types": {
-            "database": {"shape": "cylinder", "fill": "#1c3b70", "border": "#ffffff", "text": "#ffffff"},
-            "api": {"shape": "component", "fill": "#1c3b70", "border": "#ffffff", "text": "#ffffff"},
-            "error": {"shape": "box", "style": "dashed", "fill": "#1c3b70", "border": "#ff6b6b", "text": "#ff6b6b"},
-            "ui": {"shape": "rect", "fill": "#1c3b70", "border": "#ffffff", "text": "#ffffff"},
-            "actor": {"shape": "ellipse", "fill": "#1c3b70", "border": "#ffffff", "text": "#ffffff"}
-        }
-    },
-    "Minimalist": {
-        "bgcolor": "#fafafa",
-        "edge_color": "#cccccc",
-        "font": "Arial",
-        "default": {"shape": "box", "style": "rounded", "fill": "#ffffff", "border": "#333333", "text": "#333333"},
-        "types": {
-            "database": {"shape": "cylinder", "fill": "#ffffff", "border": "#666666", "text": "#333333"},
-            "api": {"shape": "component", "fill": "#ffffff", "border": "#666666", "text": "#333333"},
-            "error": {"shape": "box", "style": "dashed", "fill": "#ffffff", "border": "#cc0000", "text": "#cc0000"},
-            "ui": {"shape": "rect", "fill": "#ffffff", "border": "#666666", "text": "#333333"},
-            "actor": {"shape": "ellipse", "fill": "#ffffff", "border": "#666666", "text": "#333333"}
-        }
-    },
-    "Vibrant": {
-        "bgcolor": "#ffffff",
-        "edge_color": "#333333",
-        "font": "Verdana",
-        "default": {"shape": "box", "style": "rounded,filled", "fill": "#e8f4f8", "border": "#2c5aa0", "text": "#1a1a1a"},
-        "types": {
-            "database": {"shape": "cylinder", "fill": "#fff4e6", "border": "#ff8c00", "text": "#1a1a1a"},
-            "api": {"shape": "component", "fill": "#e8f5e9", "border": "#4caf50", "text": "#1a1a1a"},
-            "error": {"shape": "box", "style": "filled,dashed", "fill": "#ffebee", "border": "#f44336", "text": "#1a1a1a"},
-            "ui": {"shape": "rect", "fill": "#f3e5f5", "border": "#9c27b0", "text": "#1a1a1a"},
-            "actor": {"shape": "ellipse", "fill": "#e1f5fe", "border": "#03a9f4", "text": "#1a1a1a"}
-        }
-    }
-}
-
-def get_node_type(label):
-    label_lower = label.lower()
-    if any(x in label_lower for x in ["db", "database", "store", "storage", "sql", "oracle"]): return "database"
-    elif any(x in label_lower for x in ["api", "post", "get", "endpoint", "request"]): return "api"
-    elif any(x in label_lower for x in ["error", "failure", "401", "403", "500"]): return "error"
-    elif any(x in label_lower for x in ["user", "customer", "actor"]): return "actor"
-    elif any(x in label_lower for x in ["dashboard", "ui", "screen", "dialog", "wizard", "mode"]): return "ui"
-    return "default"
-
-def get_graphviz_style(label, theme_name, visualization_mode="flow"):
-    theme = THEMES[theme_name]
-    node_type = get_node_type(label)
-    style_config = theme["types"].get(node_type, theme["default"])
-    base_config = theme["default"].copy()
-    base_config.update(style_config)
-    s = base_config
-    
-    # Enhanced styling based on visualization mode
-    if visualization_mode == "mindmap":
-        # Use more organic shapes for mind maps
-        shape = "ellipse" if node_type == "default" else s["shape"]
-        style = f'style="{s.get("style", "filled")},rounded"'
-    elif visualization_mode == "sequence":
-        # Use boxes for sequence diagrams
-        shape = "box"
-        style = f'style="{s.get("style", "filled")},rounded"'
-    elif visualization_mode == "network":
-        # Use varied shapes for network diagrams
-        shape = s["shape"]
-        style = f'style="{s.get("style", "filled")},rounded"'
-    else:
-        shape = s["shape"]
-        style = f'style="{s.get("style", "filled")}"'
-    
-    return f'shape="{shape}", {style}, fillcolor="{s["fill"]}", color="{s["border"]}", fontcolor="{s["text"]}"'
-
-def get_drawio_style(label):
-    node_type = get_node_type(label)
-    base_style = "rounded=1;whiteSpace=wrap;html=1;absoluteArcSize=1;arcSize=14;strokeWidth=2;"
-    if node_type == "database": return "shape=cylinder3;whiteSpace=wrap;html=1;boundedLbl=1;backgroundOutline=1;size=15;fillColor=#fff2cc;strokeColor=#d6b656;"
-    elif node_type == "api": return "shape=component;align=left;spacingLeft=36;fillColor=#d5e8d4;strokeColor=#82b366;"
-    elif node_type == "error": return "rounded=1;whiteSpace=wrap;html=1;fillColor=#f8cecc;strokeColor=#b85450;dashed=1;"
-    elif node_type == "actor": return "shape=ellipse;fillColor=#dae8fc;strokeColor=#6c8ebf;"
-    elif node_type == "ui": return "rounded=1;whiteSpace=wrap;html=1;fillColor=#e1d5e7;strokeColor=#9673a6;"
-    return base_style + "fillColor=#f5f5f5;strokeColor=#666666;fontColor=#333333;"
-
-def parse_diagram_data(text):
-    """Enhanced parser with edge label support."""
-    lines = text.split('\n')
-    clusters = [] 
-    nodes = {}    
-    edges = []  # Now stores (src, dst, label) tuples
-    current_cluster = None
-    cluster_counter = 0
-    last_node_id_of_prev_line = None
-    connect_next_line = False
-    arrow_split_re = r'\s*(?:→|->|=>)\s*'
-    edge_label_re = r'\[([^\]]+)\]'  # Matches [label] on edges
-    
-    for line in lines:
-        line = line.strip()
-        if not line: continue
-            
-        if line.startswith('#'):
-            title = line.lstrip('#').strip()
-            current_cluster = {'id': f'cluster_{cluster_counter}', 'title': title, 'nodes': set()}
-            clusters.append(current_cluster)
-            cluster_counter += 1
-            last_node_id_of_prev_line = None 
-            connect_next_line = False
-            continue
-
-        clean_line_check = line.replace(" ", "")
-        if clean_line_check in ['↓', 'v', '|', '||']:
-            connect_next_line = True
-            continue
-            
-        # Extract edge labels from the line
-        edge_labels = {}
-        for match in re.finditer(edge_label_re, line):
-            label_text = match.group(1)
-            # Find the arrow before this label
-            pos = match.start()
-            # Simple heuristic: label belongs to the arrow before it
-            edge_labels[pos] = label_text
-            line = line[:match.start()] + line[match.end():]
-            
-        parts = re.split(arrow_split_re, line)
-        row_node_ids = []
-        
-        for idx, part in enumerate(parts):
-            label = part.strip().replace("┌", "").replace("┐", "").replace("└", "").replace("┘", "").replace("│", "")
-            if label.endswith("↓"):
-                label = label[:-1].strip()
-                connect_next_line = True
-            if label.startswith("↓"):
-                label = label[1:].strip()
-                connect_next_line = True
-            if not label: continue
-                
-            nid = re.sub(r'\W+', '_', label).strip('_')
-            if not nid: nid = f"node_{abs(hash(label))}"
-            
-            # Add Icons to Label
-            nodes[nid] = add_icons(label)
-            row_node_ids.append(nid)
-            
-            if current_cluster:
-                current_cluster['nodes'].add(nid)
-
-        if not row_node_ids: continue
-
-        if connect_next_line and last_node_id_of_prev_line:
-            # Check for edge label
-            edge_label = edge_labels.get(0, "") if edge_labels else ""
-            edges.append((last_node_id_of_prev_line, row_node_ids[0], edge_label))
-            connect_next_line = False
-        
-        for i in range(len(row_node_ids) - 1):
-            # Check for edge label between nodes
-            edge_label = edge_labels.get(i, "") if edge_labels else ""
-            edges.append((row_node_ids[i], row_node_ids[i+1], edge_label))
-            
-        last_node_id_of_prev_line = row_node_ids[-1]
-
-    return nodes, edges, clusters
-
-def generate_dot_code(nodes, edges, clusters, theme_name, layout_engine="dot", splines="ortho", visualization_mode="flow", collapsed_clusters=None):
-    """
-    Generate Graphviz DOT code with enhanced visualization modes.
-    """
-    if collapsed_clusters is None:
-        collapsed_clusters = set()
-    
-    theme = THEMES[theme_name]
-    
-    engine_map = {
-        "Hierarchy (Waterfall)": "dot",
-        "Organic (Force)": "neato",
-        "Circular (Ring)": "circo",
-        "Radial (Star)": "twopi",
-        "Freeform": "fdp"
-    }
-    engine = engine_map.get(layout_engine, "dot")
-    
-    # Adjust layout based on visualization mode
-    if visualization_mode == "sequence":
-        rankdir_str = 'rankdir=LR;'
-        engine = "dot"
-    elif visualization_mode == "mindmap":
-        engine = "twopi"
-        rankdir_str = ''
-    elif visualization_mode == "network":
-        engine = "neato"
-        rankdir_str = ''
-    else:
-        rankdir_str = 'rankdir=TB;' if engine == 'dot' else ''
-    
-    splines_val = 'curved' if engine in ['neato', 'fdp'] or visualization_mode == "mindmap" else splines
-    
-    # Enhanced styling based on visualization mode
-    node_penwidth = 2.0 if visualization_mode in ["network", "mindmap"] else 1.5
-    edge_penwidth = 1.5 if visualization_mode == "sequence" else 1.0
-    
-    dot = [
-        'digraph G {',
-        f'  layout={engine};',
-        f'  {rankdir_str}',
-        f'  bgcolor="transparent";',
-        f'  splines={splines_val};',
-        '  overlap=false;',  
-        f'  nodesep={0.8 if visualization_mode == "mindmap" else 0.6};',
-        f'  ranksep={1.2 if visualization_mode == "mindmap" else 0.8};',
-        f'  node [fontname="{theme["font"]}", fontsize={12 if visualization_mode == "mindmap" else 10}, penwidth={node_penwidth}];',
-        f'  edge [fontname="{theme["font"]}", fontsize=9, color="{theme["edge_color"]}", arrowsize=0.8, penwidth={edge_penwidth}];'
-    ]
-    
-    def escape_label(s): return s.replace('"', '\\"')
-    
-    rendered_nodes = set()
-    use_clusters = engine in ['dot', 'fdp'] and visualization_mode != "sequence"
-    
-    if use_clusters:
-        for c in clusters:
-            cluster_id = c["id"]
-            is_collapsed = cluster_id in collapsed_clusters
-            
-            dot.append(f'  subgraph {cluster_id} {{')
-            if is_collapsed:
-                # Collapsed cluster - show only title
-                dot.append(f'    label="{escape_label(c["title"])} [Collapsed]";')
-                dot.append(f'    style="rounded,dashed,filled";')
-                dot.append(f'    fillcolor="{theme["default"]["fill"]}";')
-            else:
-                dot.append(f'    label="{escape_label(c["title"])}";')
-                dot.append(f'    style="rounded,dashed";')
-                dot.append(f'    color="{theme["edge_color"]}";')
-                dot.append(f'    fontcolor="{theme["edge_color"]}";')
-            
-            if not is_collapsed:
-                for nid in c['nodes']:
-                    if nid in nodes:
-                        style = get_graphviz_style(nodes[nid], theme_name, visualization_mode)
-                        dot.append(f'    {nid} [label="{escape_label(nodes[nid])}", {style}];')
-                        rendered_nodes.add(nid)
-            dot.append('  }')
-            
-    for nid, label in nodes.items():
-        if not use_clusters or nid not in rendered_nodes:
-            style = get_graphviz_style(label, theme_name, visualization_mode)
-            dot.append(f'    {nid} [label="{escape_label(label)}", {style}];')
-            
-    for edge in edges:
-        if len(edge) == 3 and edge[2]:  # Has label
-            src, dst, label = edge
-            edge_style = 'style="dashed"' if visualization_mode == "sequence" else ''
-            dot.append(f'    {src} -> {dst} [label="{escape_label(label)}" {edge_style}];')
-        else:
-            src, dst = edge[0], edge[1]
-            edge_style = 'style="dashed"' if visualization_mode == "sequence" else ''
-            dot.append(f'    {src} -> {dst} [{edge_style}];')
-        
-    dot.append('}')
-    return "\n".join(dot)
-
-def generate_drawio_xml(nodes, edges, clusters):
-    """Generate draw.io XML with proper layout and positioning."""
-    import uuid
-    
-    # Create a better layout - arrange nodes in a grid or flow
-    node_positions = {}
-    node_width = 180
-    node_height = 80
-    spacing_x = 250
-    spacing_y = 120
-    start_x, start_y = 40, 40
-    
-    # Calculate positions for nodes
-    node_list = list(nodes.items())
-    cols = max(3, int(len(node_list) ** 0.5) + 1)
-    
-    for idx, (nid, label) in enumerate(node_list):
-        row = idx // cols
-        col = idx % cols
-        x = start_x + col * spacing_x
-        y = start_y + row * spacing_y
-        node_positions[nid] = (x, y)
-    
-    # Build XML
-    diagram_id = str(uuid.uuid4())
-    xml = [
-        '<mxfile host="app.diagrams.net" modified="' + datetime.now().strftime('%Y-%m-%dT%H:%M:%S.000Z') + '" agent="CloudDMate" version="21.0.0" type="device">',
-        f'  <diagram id="{diagram_id}" name="Architecture">',
-        '    <mxGraphModel dx="1422" dy="794" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" arrows="1" fold="1" page="1" pageScale="1" pageWidth="1169" pageHeight="827" math="0" shadow="0">',
-        '      <root>',
-        '        <mxCell id="0" />',
-        '        <mxCell id="1" parent="0" />'
-    ]
-    
-    # Add clusters as containers (swimlanes)
-    cluster_cells = {}
-    cluster_bounds = {}
-    
-    if clusters:
-        for c_idx, c in enumerate(clusters):
-            cluster_id = f"cluster_{c_idx}"
-            cluster_cells[c["id"]] = cluster_id
-            
-            # Calculate cluster bounds based on nodes in cluster
-            cluster_nodes = [nid for nid in c['nodes'] if nid in node_positions]
-            if cluster_nodes:
-                positions = [node_positions[nid] for nid in cluster_nodes]
-                min_x = min(p[0] for p in positions) - 20
-                min_y = min(p[1] for p in positions) - 40
-                max_x = max(p[0] for p in positions) + node_width + 20
-                max_y = max(p[1] for p in positions) + node_height + 20
-                
-                cluster_bounds[cluster_id] = (min_x, min_y, max_x - min_x, max_y - min_y)
-                
-                xml.append(f'        <mxCell id="{cluster_id}" value="{html.escape(c["title"])}" style="swimlane;whiteSpace=wrap;html=1;fillColor=#dae8fc;strokeColor=#6c8ebf;startSize=30;fontStyle=1;fontSize=14;" vertex="1" parent="1">')
-                xml.append(f'          <mxGeometry x="{min_x}" y="{min_y}" width="{max_x - min_x}" height="{max_y - min_y}" as="geometry" />')
-                xml.append('        </mxCell>')
-    
-    # Add nodes
-    for nid, label in nodes.items():
-        style = get_drawio_style(label)
-        x, y = node_positions.get(nid, (start_x, start_y))
-        
-        # Determine parent (cluster or root)
-        parent = "1"
-        for c in clusters:
-            if nid in c['nodes'] and c["id"] in cluster_cells:
-                parent = cluster_cells[c["id"]]
-                # Adjust position relative to cluster (account for cluster header)
-                if parent in cluster_bounds:
-                    cluster_x, cluster_y, _, _ = cluster_bounds[parent]
-                    x = x - cluster_x
-                    y = y - cluster_y + 30  # Account for cluster header
-                break
-        
-        xml.append(f'        <mxCell id="{nid}" value="{html.escape(label)}" style="{style}" vertex="1" parent="{parent}">')
-        xml.append(f'          <mxGeometry x="{x}" y="{y}" width="{node_width}" height="{node_height}" as="geometry" />')
-        xml.append('        </mxCell>')
-    
-    # Add edges
-    edge_id = 10000
-    for edge in edges:
-        if len(edge) == 3 and edge[2]:  # Has label
-            src, dst, label = edge
-            edge_label = html.escape(label)
-            xml.append(f'        <mxCell id="{edge_id}" value="{edge_label}" style="edgeStyle=orthogonalEdgeStyle;rounded=0;orthogonalLoop=1;jettySize=auto;html=1;strokeWidth=2;" edge="1" parent="1" source="{src}" target="{dst}">')
-        else:
-            src, dst = edge[0], edge[1]
-            xml.append(f'        <mxCell id="{edge_id}" value="" style="edgeStyle=orthogonalEdgeStyle;rounded=0;orthogonalLoop=1;jettySize=auto;html=1;strokeWidth=2;" edge="1" parent="1" source="{src}" target="{dst}">')
-        xml.append('          <mxGeometry relative="1" as="geometry" />')
-        xml.append('        </mxCell>')
-        edge_id += 1
-    
-    xml.append('      </root></mxGraphModel></diagram></mxfile>')
-    return "\n".join(xml)
-
 def render_drawio_editor(xml_content):
     """Render fully functional draw.io editor with save/load capabilities."""
     # Use base64 encoding for safe XML transmission
@@ -1040,21 +604,6 @@ def render_drawio_editor(xml_content):
     """
     components.html(html_code, height=800)
 
-def export_to_json(nodes, edges, clusters):
-    """Export diagram data to JSON format."""
-    return json.dumps({
-        "metadata": {
-            "version": "2.0",
-            "created": datetime.now().isoformat(),
-            "node_count": len(nodes),
-            "edge_count": len(edges),
-            "cluster_count": len(clusters)
-        },
-        "nodes": {nid: label for nid, label in nodes.items()},
-        "edges": [{"source": e[0], "target": e[1], "label": e[2] if len(e) > 2 else ""} for e in edges],
-        "clusters": [{"id": c["id"], "title": c["title"], "nodes": list(c["nodes"])} for c in clusters]
-    }, indent=2)
-
 def export_to_pdf(svg_code):
     """Export SVG to PDF using weasyprint or similar."""
     try:
@@ -1088,62 +637,9 @@ def export_to_svg_file(svg_code):
         return svg_match.group(0)
     return svg_code
 
-def load_from_json(json_str):
-    """Load diagram data from JSON format."""
-    try:
-        data = json.loads(json_str)
-        nodes = data.get("nodes", {})
-        edges = [(e["source"], e["target"], e.get("label", "")) for e in data.get("edges", [])]
-        clusters = []
-        for c in data.get("clusters", []):
-            clusters.append({"id": c["id"], "title": c["title"], "nodes": set(c["nodes"])})
-        return nodes, edges, clusters
-    except Exception as e:
-        raise ValueError(f"Invalid JSON format: {e}")
-
-def validate_diagram_text(text):
-    """Validate diagram text and return errors/warnings."""
-    errors = []
-    warnings = []
-    
-    if not text or not text.strip():
-        errors.append("Diagram text is empty. Please enter some content.")
-        return errors, warnings
-    
-    lines = text.split('\n')
-    has_cluster = False
-    has_nodes = False
-    
-    for i, line in enumerate(lines, 1):
-        line = line.strip()
-        if not line:
-            continue
-        
-        # Check for clusters
-        if line.startswith('#'):
-            has_cluster = True
-            if len(line) > 100:
-                warnings.append(f"Line {i}: Cluster title is very long (>{len(line)} chars)")
-        
-        # Check for nodes
-        if any(arrow in line for arrow in ['→', '->', '=>']):
-            has_nodes = True
-            # Check for unbalanced brackets
-            if line.count('[') != line.count(']'):
-                errors.append(f"Line {i}: Unbalanced brackets in edge labels")
-        
-        # Check for invalid characters
-        if any(char in line for char in ['<', '>']):
-            warnings.append(f"Line {i}: Contains potentially problematic characters (< or >)")
-    
-    if not has_nodes and not has_cluster:
-        warnings.append("No nodes or clusters detected. Make sure to use arrows (→, ->, =>) or cluster markers (#)")
-    
-    return errors, warnings
-
-def make_svg_interactive(svg_code, clusters, search_term=""):
+def make_svg_interactive(svg_code, graph, search_term=""):
     """Add JavaScript interactivity: collapsible clusters, zoom/pan, and search."""
-    cluster_data = {c["id"]: c["title"] for c in clusters} if clusters else {}
+    cluster_data = dict(zip(graph.cluster_ids, graph.cluster_titles))
     
     js_code = f"""
     <script>
@@ -1438,24 +934,107 @@ def make_svg_interactive(svg_code, clusters, search_term=""):
     
     return f'<div id="svg-container" style="position: relative; width: 100%; height: 100%; max-width: 100%; box-sizing: border-box; overflow: hidden;">{svg_code}</div>{js_code}'
 
-@st.cache_data(ttl=300)
-def cached_render_svg(dot_code_hash, dot_code):
-    """Cache SVG rendering to improve performance."""
+@st.cache_resource
+def get_renderer(backend):
+    """One layout pool per backend choice, shared across reruns and sessions:
+    every render (view, PNG, PDF) queues on its warm workers."""
+    return LayoutPool(make_renderer(backend, warm=True), workers=RENDER_WORKERS, queue_size=RENDER_QUEUE)
+
+def responsive_svg(svg_code):
+    svg_code = re.sub(r'width=".*?"', 'width="100%"', svg_code, count=1)
+    return re.sub(r'height=".*?"', '', svg_code, count=1)
+
+@st.cache_resource
+def get_disk_cache():
+    """Rendered artifacts on disk, shared by every worker process and kept
+    across restarts. DIAGRAM_CACHE_DIR and DIAGRAM_CACHE_MB configure it."""
+    return DiskCache(os.environ.get("DIAGRAM_CACHE_DIR", os.path.join(".cache", "diagrams")),
+                     max_bytes=int(os.environ.get("DIAGRAM_CACHE_MB", "256")) << 20)
+
+@st.cache_resource(max_entries=32)
+def get_layout_result(dot_digest, _dot_code, backend="auto"):
+    """The diagram laid out once per DOT digest (from the pipeline's dot
+    stage); SVG, PNG and PDF are drawn from it when first needed, or read
+    from the disk cache."""
+    return LayoutResult(get_renderer(backend), _dot_code, cache=get_disk_cache(), digest=dot_digest)
+
+def render_packed(dot_parts, backend="auto"):
+    """Renders the DOT of each component batch, given as (DOT, digest)
+    pairs, concurrently and packs the SVGs into one, so the wait is about
+    that of the largest batch. Each part's SVG is kept by its layout result
+    and the disk cache; a failed part raises and is tried again next run."""
+    parts = [get_layout_result(digest, dot, backend) for dot, digest in dot_parts]
+    with ThreadPoolExecutor(len(parts)) as pool:
+        svgs = list(pool.map(lambda part: part.output("svg"), parts))
+    return responsive_svg(pack_svgs(svgs))
+
+RENDER_WORKERS = 4  # layout pool workers, and concurrent renders for a diagram's parts or clusters
+RENDER_QUEUE = 16  # renders waiting for a worker before new ones are turned away
+
+def render_clusters_svg(backend, graph, *options):
+    """Two-level render (see render_hierarchical()); cluster drawings are
+    kept across reruns in the session pipeline."""
+    renderer = get_renderer(backend)
+    cache = st.session_state.pipeline.cluster_svgs
+    return responsive_svg(render_hierarchical(graph, *options, render=lambda dot: renderer.render(dot, "svg").data.decode("utf-8"),
+                                              cache=cache, workers=RENDER_WORKERS))
+
+def render_view_svg(layout_result, dot_parts=None, cluster_args=None, backend="auto"):
+    """Responsive SVG of the diagram: rendered cluster by cluster from
+    `cluster_args`, packed from `dot_parts` when it was split into component
+    batches, or else drawn from `layout_result`. Returns (svg, error)."""
     try:
-        resp = requests.post(
-            "https://quickchart.io/graphviz", 
-            json={"graph": dot_code, "format": "svg"}, 
-            timeout=15
-        )
-        if resp.status_code == 200:
-            svg_code = resp.text
-            svg_code = re.sub(r'width=".*?"', 'width="100%"', svg_code, count=1)
-            svg_code = re.sub(r'height=".*?"', '', svg_code, count=1)
-            return svg_code, None
-        return None, f"Service returned status {resp.status_code}"
+        if cluster_args:
+            return st.session_state.pipeline.stage("cluster_svg", render_clusters_svg)(backend, *cluster_args).value, None
+        if dot_parts:
+            return render_packed(dot_parts, backend), None
+        return responsive_svg(layout_result.output("svg").decode("utf-8")), None
     except Exception as e:
         return None, str(e)
 
+# download_button calls a callable `data` on click only from Streamlit 1.52
+LAZY_DOWNLOADS = tuple(int(p) for p in st.__version__.split(".")[:2]) >= (1, 52)
+
+def download_data(build):
+    """`data` for a download button: `build` itself where Streamlit calls it
+    on click, else its bytes now (None if they cannot be made)."""
+    if LAZY_DOWNLOADS:
+        return build
+    try:
+        return build()
+    except RuntimeError:
+        return None
+
+def pdf_download(layout_result, view_svg):
+    """Callable for a PDF download button: Graphviz's PDF of the layout
+    where the renderer makes PDFs, else the printable page of the SVG."""
+    def build():
+        if layout_result.supports("pdf"):
+            try:
+                return layout_result.output("pdf")
+            except RuntimeError:
+                pass
+        return export_to_pdf(view_svg)
+    return build
+
+def render_summary(renderer, renders_before):
+    """One line on the renders made since the renderer's count was
+    `renders_before`: backend, time and any fallbacks."""
+    new = list(renderer.history)[-(renderer.renders - renders_before):] if renderer.renders > renders_before else []
+    if not new:
+        return "⚡ Served from the render cache"
+    done = [r for r in new if not r.error]
+    failed = [r for r in new if r.error]
+    backends = ", ".join(sorted({r.backend for r in done})) or "no renderer"
+    if len(done) == 1:
+        line = f"🖥️ Rendered by {backends} in {done[0].seconds:.2f} s"
+    else:
+        line = (f"🖥️ {len(done)} renders by {backends}, {sum(r.seconds for r in done):.2f} s in total "
+                f"(slowest {max((r.seconds for r in done), default=0):.2f} s)")
+    if failed:
+        line += f" · {len(failed)} failed on {', '.join(sorted({r.backend for r in failed}))}: {failed[-1].error}"
+    return line
+
 PRESETS = {
     "Full Authentication": """## Authentication Flow
 User Arrives → Login Dialog → Enter Credentials
@@ -1677,6 +1256,17 @@ visualization_mode = st.sidebar.selectbox(
     help="Choose the visualization style - Flow for processes, Sequence for interactions, Mind Map for ideas, Network for connections."
 )
 
+edge_merge = st.sidebar.selectbox(
+    "Repeated Edges",
+    ["duplicates", "parallel", "keep"],
+    format_func=lambda x: {
+        "duplicates": "🔗 Merge identical edges",
+        "parallel": "🔗 Merge all edges between two nodes",
+        "keep": "➖ Keep every edge"
+    }[x],
+    help="Repeated flows are drawn once, labelled ×count and drawn thicker. Merging all edges between two nodes also joins their labels."
+)
+
 st.sidebar.markdown("---")
 st.sidebar.markdown("### 🎨 Styling & Layout")
 
@@ -1706,8 +1296,28 @@ if "auto_refresh" not in st.session_state:
 auto_refresh = st.sidebar.checkbox("🔄 Auto-refresh", value=st.session_state.auto_refresh, help="Automatically update diagram as you type")
 st.session_state.auto_refresh = auto_refresh
 
+layout_budget = st.sidebar.slider(
+    "⏱️ Layout budget (s)", 2.0, 15.0, DEFAULT_BUDGET_SECONDS, 0.5,
+    help="Estimated layout time allowed before the layout is simplified (the renderer gives up at 15 s)"
+)
+local_available = LocalRenderer().available()
+render_backend = st.sidebar.selectbox(
+    "🖥️ Renderer",
+    ["auto", "local", "quickchart"],
+    format_func=lambda x: {
+        "auto": "⚡ Auto (local Graphviz, else quickchart.io)",
+        "local": "🖥️ Local Graphviz" + ("" if local_available else " (not installed)"),
+        "quickchart": "☁️ quickchart.io"
+    }[x],
+    help="Where diagrams are laid out. Auto uses the Graphviz binaries on this host when installed and falls back to quickchart.io."
+)
+render_clusters = st.sidebar.checkbox(
+    "🧩 Render clusters separately", value=False,
+    help="Lay out each cluster on its own and place the clusters as boxes. Edits then re-render only the changed clusters; edges between clusters attach to the cluster boxes."
+)
+
 st.sidebar.markdown("---")
-st.sidebar.info("💡 **Tip:** Use `[label]` on arrows to add edge labels. Icons are auto-added based on keywords. Click cluster titles to collapse/expand!")
+st.sidebar.info("💡 **Tip:** Use `[label]` on arrows to add edge labels. Icons are auto-added based on keywords. Collapse clusters with the 📦 picker above the diagram!")
 
 # --- Header with Branding ---
 st.markdown("""
@@ -1860,17 +1470,25 @@ with col1:
             st.session_state.last_update = time.time()
             # The rerun will happen naturally when text changes
     
-    # Validate input with better layout
+    # Every step from text to diagram is memoized per session; a rerun only
+    # recomputes the stages whose inputs changed. Parsing validates in the
+    # same pass and only re-scans the '#' blocks that changed. Saved
+    # diagrams can be pulled in by name with '!include <name>'.
+    if "pipeline" not in st.session_state:
+        st.session_state.pipeline = DiagramPipeline()
+    pipeline = st.session_state.pipeline
     if user_text:
-        errors, warnings = validate_diagram_text(user_text)
+        modules = {name: saved["text"] for name, saved in st.session_state.saved_diagrams.items()}
+        parsed = pipeline.parse(user_text, modules)
+        _, errors, warnings = parsed.value
         if errors:
             st.markdown("---")
             for error in errors:
-                st.error(f"❌ {error}")
+                st.error(f"❌ {format_diagnostic(error)}")
         if warnings:
             st.markdown("---")
             for warning in warnings:
-                st.warning(f"⚠️ {warning}")
+                st.warning(f"⚠️ {format_diagnostic(warning)}")
     
     # Auto-refresh indicator
     if auto_refresh:
@@ -1886,21 +1504,66 @@ with col2:
     
     if user_text:
         try:
-            # Validate before parsing
-            errors, warnings = validate_diagram_text(user_text)
+            # Validation and parsing already ran in the input column
             if errors:
                 st.error("❌ **Validation Errors Found**")
                 st.error("Please fix the following errors before generating the diagram:")
                 for i, error in enumerate(errors, 1):
-                    st.error(f"{i}. {error}")
+                    st.error(f"{i}. {format_diagnostic(error)}")
                 st.info("💡 **Tip:** Check the syntax guide below for help with proper formatting.")
             else:
-                nodes, edges, clusters = parse_diagram_data(user_text)
-                
+                graph_out = pipeline.edges(pipeline.graph_of(parsed), edge_merge)
+                graph = graph_out.value
+
+                # Collapsed clusters are drawn as single proxy nodes. The set
+                # lives in the session under each cluster's title and
+                # occurrence (DiagramGraph.cluster_keys()), so inserting or
+                # deleting a cluster above one does not collapse another;
+                # keys that no longer exist after an edit are dropped before
+                # the picker is drawn.
+                cluster_ids = dict(zip(graph.cluster_keys(), graph.cluster_ids))
+                cluster_names = {}
+                for key, title in zip(cluster_ids, graph.cluster_titles):
+                    n = int(key.rsplit("#", 1)[1])
+                    cluster_names[key] = f"{title} ({n + 1})" if n else title
+                st.session_state.collapsed_clusters = [
+                    c for c in st.session_state.get("collapsed_clusters", []) if c in cluster_ids
+                ]
+                if cluster_ids:
+                    st.multiselect(
+                        "📦 Collapse clusters:",
+                        list(cluster_ids),
+                        format_func=cluster_names.get,
+                        key="collapsed_clusters",
+                        help="Collapsed clusters become one node; their edges are merged and counted"
+                    )
+                collapsed_clusters = {cluster_ids[c] for c in st.session_state.collapsed_clusters}
+
+                # Simplify the layout when it would not finish within the budget
+                layout_plan = pipeline.layout(graph_out, layout_engine, splines, visualization_mode, collapsed_clusters, layout_budget)
+                if layout_plan.value.changes:
+                    st.info(f"⏱️ Simplified layout to fit the {layout_budget:g} s budget: "
+                            + "; ".join(layout_plan.value.changes)
+                            + ". Collapse clusters or raise the budget for the full layout.")
+
                 # Generate DOT with visualization mode
-                collapsed_clusters = set()  # Keep for function signature but don't show UI controls
-                dot_code = generate_dot_code(nodes, edges, clusters, selected_theme, layout_engine, splines, visualization_mode, collapsed_clusters)
-                drawio_xml = generate_drawio_xml(nodes, edges, clusters)
+                dot_code, dot_digest = pipeline.dot(graph_out, selected_theme, layout_engine, splines, visualization_mode, collapsed_clusters, True, layout_plan).value  # compact DOT
+
+                # Disconnected parts of a large diagram are laid out in parallel
+                render_parts = pipeline.components(graph_out, RENDER_WORKERS)
+                dot_parts = None
+                if len(render_parts) > 1:
+                    dot_parts = tuple(  # (DOT, digest) pairs
+                        pipeline.dot(part, selected_theme, layout_engine, splines, visualization_mode, collapsed_clusters, True, layout_plan).value
+                        for part in render_parts
+                    )
+
+                # Two-level rendering: each cluster laid out (and cached) on its own
+                cluster_args = None
+                if render_clusters and graph.cluster_count > 1:
+                    cluster_args = (graph_out, selected_theme, layout_engine, splines, visualization_mode,
+                                    collapsed_clusters, True, layout_plan)
+                drawio_xml = pipeline.drawio(graph_out).value
                 
                 # Search functionality with better layout
                 search_col1, search_col2 = st.columns([3, 1])
@@ -1915,7 +1578,7 @@ with col2:
                     st.write("")  # Spacer
                     st.write("")  # Spacer
                     if search_term:
-                        st.caption(f"🔎 {len([n for n in nodes.values() if search_term.lower() in n.lower()])} found")
+                        st.caption(f"🔎 {len([n for n in graph.labels if search_term.lower() in n.lower()])} found")
                 
                 # Display stats with colorful cards
                 st.markdown("<br>", unsafe_allow_html=True)
@@ -1925,7 +1588,7 @@ with col2:
                     st.markdown(f"""
                     <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 1rem; border-radius: 12px; text-align: center; box-shadow: 0 4px 8px rgba(102, 126, 234, 0.3);">
                         <div style="font-size: 2rem; margin-bottom: 0.5rem;">📊</div>
-                        <div style="color: white; font-size: 2rem; font-weight: bold;">{len(nodes)}</div>
+                        <div style="color: white; font-size: 2rem; font-weight: bold;">{graph.node_count}</div>
                         <div style="color: rgba(255, 255, 255, 0.9); font-size: 0.9rem;">Nodes</div>
                     </div>
                     """, unsafe_allow_html=True)
@@ -1934,7 +1597,7 @@ with col2:
                     st.markdown(f"""
                     <div style="background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%); padding: 1rem; border-radius: 12px; text-align: center; box-shadow: 0 4px 8px rgba(240, 147, 251, 0.3);">
                         <div style="font-size: 2rem; margin-bottom: 0.5rem;">🔗</div>
-                        <div style="color: white; font-size: 2rem; font-weight: bold;">{len(edges)}</div>
+                        <div style="color: white; font-size: 2rem; font-weight: bold;">{graph.edge_count}</div>
                         <div style="color: rgba(255, 255, 255, 0.9); font-size: 0.9rem;">Edges</div>
                     </div>
                     """, unsafe_allow_html=True)
@@ -1943,7 +1606,7 @@ with col2:
                     st.markdown(f"""
                     <div style="background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%); padding: 1rem; border-radius: 12px; text-align: center; box-shadow: 0 4px 8px rgba(79, 172, 254, 0.3);">
                         <div style="font-size: 2rem; margin-bottom: 0.5rem;">📦</div>
-                        <div style="color: white; font-size: 2rem; font-weight: bold;">{len(clusters)}</div>
+                        <div style="color: white; font-size: 2rem; font-weight: bold;">{graph.cluster_count}</div>
                         <div style="color: rgba(255, 255, 255, 0.9); font-size: 0.9rem;">Clusters</div>
                     </div>
                     """, unsafe_allow_html=True)
@@ -1961,20 +1624,32 @@ with col2:
                 
                 tab1, tab2, tab3 = st.tabs(["📊 Smart View", "✏️ Visual Editor", "📥 Export"])
                 with tab1:
-                    png_data = None
                     svg_file_data = None
+                    view_svg = None
+
+                    # Laid out once per DOT; PNG and PDF are only drawn on download
+                    layout_result = get_layout_result(dot_digest, dot_code, render_backend)
+                    png_download = lambda: layout_result.output("png", dpi=300)
 
                     # 1. Fetch Responsive SVG for Screen with caching
                     try:
-                        dot_hash = hashlib.md5(dot_code.encode()).hexdigest()
-                        svg_code, error_msg = cached_render_svg(dot_hash, dot_code)
+                        renderer = get_renderer(render_backend)
+                        renders_before = renderer.renders
+                        svg_code, error_msg = render_view_svg(layout_result, dot_parts, cluster_args, render_backend)
+                        view_svg = svg_code
+                        if svg_code:
+                            st.session_state.last_view_svg = svg_code
+                        elif st.session_state.get("last_view_svg"):
+                            # Keep the last diagram on screen while the renderer is down
+                            st.warning(f"⚠️ Could not render this version ({error_msg}). Showing the last diagram that rendered.")
+                            svg_code = st.session_state.last_view_svg
                         
                         if svg_code:
                             # Make interactive with zoom, pan, search, and collapsible clusters
-                            svg_code = make_svg_interactive(svg_code, clusters, search_term)
+                            svg_code = pipeline.stage("interactive", make_svg_interactive)(svg_code, graph_out, search_term).value
                             
                             # Store clean SVG for export
-                            svg_file_data = export_to_svg_file(svg_code)
+                            svg_file_data = pipeline.stage("svg_file", export_to_svg_file)(svg_code).value
                             
                             # Wrap in container with enhanced styling and proper overflow handling
                             container_style = f"""
@@ -1994,25 +1669,16 @@ with col2:
                             """
                             st.markdown(f"""<div style="{container_style}">{svg_code}</div>""", unsafe_allow_html=True)
                             
+                            st.caption(render_summary(renderer, renders_before))
+                            with st.expander("⏱️ Render timings", expanded=False):
+                                st.table([
+                                    {"backend": r.backend, "format": r.output_format,
+                                     "seconds": round(r.seconds, 3), "error": r.error or ""}
+                                    for r in reversed(renderer.history)
+                                ])
+
                             if search_term:
                                 st.info(f"🔍 Searching for: '{search_term}' - Matching nodes are highlighted in red")
-                            
-                            # 2. Fetch High-Res PNG for Download Only
-                            try:
-                                dot_code_dl = dot_code.replace('graph {', 'graph { dpi=300; ')
-                                resp_png = requests.post(
-                                    "https://quickchart.io/graphviz", 
-                                    json={"graph": dot_code_dl, "format": "png"}, 
-                                    timeout=15
-                                )
-                                if resp_png.status_code == 200:
-                                    png_data = resp_png.content
-                            except Exception as png_err:
-                                st.warning("⚠️ **PNG Generation Failed**")
-                                st.warning(f"High-resolution PNG could not be generated: {str(png_err)}")
-                                st.info("💡 The diagram is still available in SVG format. PNG export will be retried automatically.")
-                                with st.expander("🔍 PNG Error Details", expanded=False):
-                                    st.exception(png_err)
                         else:
                             st.error("❌ **Visualization Error**")
                             st.error(f"Could not generate diagram visualization.")
@@ -2048,6 +1714,7 @@ with col2:
                             help="Download as Draw.io format"
                         )
                     with c2: 
+                        png_data = download_data(png_download) if view_svg else None
                         if png_data: 
                             st.download_button(
                                 "🖼️ PNG", 
@@ -2055,7 +1722,7 @@ with col2:
                                 "arch.png", 
                                 "image/png", 
                                 use_container_width=True,
-                                help="Download as PNG image"
+                                help="Download as PNG image (300 dpi)"
                             )
                         else: 
                             st.info("⏳ PNG...", icon="⏳")
@@ -2090,6 +1757,7 @@ with col2:
                     st.markdown("---")
                     
                     if export_format == "PNG (Image)":
+                        png_data = download_data(png_download) if view_svg else None
                         if png_data:
                             st.download_button(
                                 "📥 Download PNG", 
@@ -2098,8 +1766,9 @@ with col2:
                                 "image/png",
                                 use_container_width=True
                             )
+                            st.caption("💡 The 300 dpi PNG is drawn from the current layout.")
                         else:
-                            st.info("⏳ Generating PNG... Please wait.")
+                            st.warning("PNG not available. Please generate a diagram first.")
                             
                     elif export_format == "SVG (Vector)":
                         if svg_file_data:
@@ -2116,11 +1785,9 @@ with col2:
                             
                     elif export_format == "PDF (Document)":
                         try:
-                            # Get clean SVG for PDF
-                            dot_hash = hashlib.md5(dot_code.encode()).hexdigest()
-                            clean_svg, _ = cached_render_svg(dot_hash, dot_code)
-                            if clean_svg:
-                                pdf_data = export_to_pdf(clean_svg)
+                            # Drawn from the same layout, when the button is clicked where supported
+                            pdf_data = download_data(pdf_download(layout_result, view_svg)) if view_svg else None
+                            if pdf_data:
                                 st.download_button(
                                     "📥 Download PDF", 
                                     pdf_data, 
@@ -2144,7 +1811,7 @@ with col2:
                                 st.exception(e)
                             
                     elif export_format == "JSON (Data)":
-                        json_data = export_to_json(nodes, edges, clusters)
+                        json_data = pipeline.json(graph_out).value
                         st.download_button(
                             "📥 Download JSON", 
                             json_data, 
@@ -2184,16 +1851,16 @@ with col2:
                     if uploaded_json:
                         try:
                             json_content = uploaded_json.read().decode('utf-8')
-                            loaded_nodes, loaded_edges, loaded_clusters = load_from_json(json_content)
+                            loaded_graph = load_from_json(json_content)
                             
                             # Reconstruct text from loaded data
                             # This is a simplified reconstruction
                             reconstructed_text = ""
-                            for c in loaded_clusters:
-                                reconstructed_text += f"## {c['title']}\n"
-                                cluster_nodes = [nid for nid in c['nodes'] if nid in loaded_nodes]
+                            for k, title in enumerate(loaded_graph.cluster_titles):
+                                reconstructed_text += f"## {title}\n"
+                                cluster_nodes = loaded_graph.cluster_nodes(k)
                                 if cluster_nodes:
-                                    reconstructed_text += " → ".join([loaded_nodes[nid] for nid in cluster_nodes]) + "\n"
+                                    reconstructed_text += " → ".join([loaded_graph.labels[i] for i in cluster_nodes]) + "\n"
                             
                             if st.button("📂 Load into Editor", use_container_width=True):
                                 st.session_state.text_input = reconstructed_text
@@ -2216,9 +1883,9 @@ with col2:
                     st.markdown("---")
                     st.markdown("### 📊 Diagram Statistics")
                     st.json({
-                        "nodes": len(nodes),
-                        "edges": len(edges),
-                        "clusters": len(clusters),
+                        "nodes": graph.node_count,
+                        "edges": graph.edge_count,
+                        "clusters": graph.cluster_count,
                         "theme": selected_theme,
                         "layout": layout_engine,
                         "visualization_mode": visualization_mode,
@@ -2316,6 +1983,7 @@ with col2:
                 <li>Use <code style="background: rgba(102, 126, 234, 0.2); padding: 2px 6px; border-radius: 4px;">→</code> or <code style="background: rgba(102, 126, 234, 0.2); padding: 2px 6px; border-radius: 4px;">-></code> or <code style="background: rgba(102, 126, 234, 0.2); padding: 2px 6px; border-radius: 4px;">=></code> for horizontal connections</li>
                 <li>Use <code style="background: rgba(102, 126, 234, 0.2); padding: 2px 6px; border-radius: 4px;">↓</code> or <code style="background: rgba(102, 126, 234, 0.2); padding: 2px 6px; border-radius: 4px;">v</code> or <code style="background: rgba(102, 126, 234, 0.2); padding: 2px 6px; border-radius: 4px;">|</code> for vertical connections</li>
                 <li>Add edge labels with <code style="background: rgba(102, 126, 234, 0.2); padding: 2px 6px; border-radius: 4px;">[label]</code> on arrows</li>
+                <li>Use <code style="background: rgba(102, 126, 234, 0.2); padding: 2px 6px; border-radius: 4px;">!include Name</code> on its own line to insert a saved diagram</li>
                 <li><strong>Example:</strong> <code style="background: rgba(102, 126, 234, 0.2); padding: 2px 6px; border-radius: 4px;">Node A [GET] → Node B → Node C</code></li>
             </ul>
         </div>
@@ -0,0 +1,72 @@
+"""Label classification benchmark: one trie-regex scan (classify_label) vs.
+the previous add_icons / get_node_type if/elif keyword chains.
+
+Each label needs its icon and its node type; the node type used to be
+computed twice more (graphviz and draw.io styles), so the legacy column
+does that too.
+
+Run from the repository root:  python benchmarks/bench_classify.py [labels ...]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_parse import WORDS, legacy_add_icons
+from diagram_keywords import classify_label
+
+def legacy_get_node_type(label):
+    label_lower = label.lower()
+    if any(x in label_lower for x in ["db", "database", "store", "storage", "sql", "oracle"]): return "database"
+    elif any(x in label_lower for x in ["api", "post", "get", "endpoint", "request"]): return "api"
+    elif any(x in label_lower for x in ["error", "failure", "401", "403", "500"]): return "error"
+    elif any(x in label_lower for x in ["user", "customer", "actor"]): return "actor"
+    elif any(x in label_lower for x in ["dashboard", "ui", "screen", "dialog", "wizard", "mode"]): return "ui"
+    return "default"
+
+def legacy(labels):
+    for label in labels:
+        legacy_add_icons(label)
+        legacy_get_node_type(label)
+        legacy_get_node_type(label)
+        legacy_get_node_type(label)
+
+def scan(labels):
+    for label in labels:
+        classify_label.__wrapped__(label)
+
+def memoized(labels):
+    for label in labels:
+        classify_label(label)
+        classify_label(label)
+        classify_label(label)
+
+def make_labels(n, distinct):
+    rng = random.Random(42)
+    pool = [f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}" for i in range(distinct)]
+    return [pool[rng.randrange(distinct)] for _ in range(n)]
+
+def timed(fn, labels):
+    classify_label.cache_clear()
+    start = time.perf_counter()
+    fn(labels)
+    return time.perf_counter() - start
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [1000000]
+    print(f"{'labels':>8} {'distinct':>8} {'legacy ns':>10} {'scan ns':>10} {'memo ns':>10}")
+    for n in sizes:
+        for distinct in (5000, n):
+            labels = make_labels(n, distinct)
+            for label in labels[:20000]:
+                icon, node_type = classify_label(label)
+                assert icon + label == legacy_add_icons(label) and node_type == legacy_get_node_type(label)
+            t_legacy = timed(legacy, labels)
+            t_scan = timed(scan, labels)
+            t_memo = timed(memoized, labels)
+            print(f"{n:>8} {distinct:>8} {t_legacy / n * 1e9:>10.0f} {t_scan / n * 1e9:>10.0f} {t_memo / n * 1e9:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Render-time benchmark: one Graphviz run over the whole graph vs.
+render_components(), which lays out batches of connected components in
+parallel and packs the SVGs. Needs a local Graphviz.
+
+Run from the repository root:  python benchmarks/bench_components.py [--dot PATH] [lines ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_parse import make_document
+from diagram_export import render_components, render_dot
+from diagram_graph import DiagramGraph
+from diagram_layout import component_batches
+from diagram_parser import parse_diagram_data
+from diagram_themes import THEMES
+
+THEME = next(iter(THEMES))
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+def main():
+    args = sys.argv[1:]
+    command = "dot"
+    if args[:1] == ["--dot"]:
+        command, args = args[1], args[2:]
+    sizes = [int(a) for a in args] or [200, 800]
+    cpus = os.cpu_count() or 1
+    print(f"{cpus} CPUs")
+    print(f"{'lines':>8} {'nodes':>7} {'batches':>8} {'whole s':>9} {'packed s':>9} {'speedup':>8}")
+    for n in sizes:
+        graph = DiagramGraph.from_parts(*parse_diagram_data(make_document(n, distinct_nodes=n * 3)))
+        batches = len(component_batches(graph, cpus))
+        whole = timed(render_dot, graph, THEME, command=command, compact=True)
+        packed = timed(render_components, graph, THEME, workers=cpus, command=command, compact=True)
+        print(f"{n:>8} {graph.node_count:>7} {batches:>8} {whole:>9.3f} {packed:>9.3f} {whole / packed:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
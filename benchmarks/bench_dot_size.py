@@ -0,0 +1,44 @@
+"""DOT size benchmark: full per-node styles vs. compact emission with
+per-type `node [...]` defaults (generate_dot_code(..., compact=True)).
+
+Reports the DOT bytes sent to the renderer and the time to generate and
+md5-hash them.
+
+Run from the repository root:  python benchmarks/bench_dot_size.py [lines ...]
+"""
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_parse import make_document
+from diagram_export import generate_dot_code
+from diagram_graph import DiagramGraph
+from diagram_parser import parse_diagram_data
+from diagram_themes import THEMES
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000, 50000]
+    theme = next(iter(THEMES))
+    print(f"{'lines':>8} {'full bytes':>12} {'compact bytes':>14} {'saved':>7} {'full ms':>9} {'compact ms':>11} {'md5 full ms':>12} {'md5 compact ms':>15}")
+    for n in sizes:
+        graph = DiagramGraph.from_parts(*parse_diagram_data(make_document(n)))
+        full, t_full = timed(lambda: generate_dot_code(graph, theme).encode('utf-8'))
+        compact, t_compact = timed(lambda: generate_dot_code(graph, theme, compact=True).encode('utf-8'))
+        _, h_full = timed(lambda: hashlib.md5(full).hexdigest())
+        _, h_compact = timed(lambda: hashlib.md5(compact).hexdigest())
+        print(f"{n:>8} {len(full):>12} {len(compact):>14} {1 - len(compact) / len(full):>6.0%} "
+              f"{t_full * 1000:>9.1f} {t_compact * 1000:>11.1f} {h_full * 1000:>12.2f} {h_compact * 1000:>15.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""Parse-time benchmark: serial parse_diagram_data vs. the chunk-parallel
+parser on one large document.
+
+Run from the repository root:  python benchmarks/bench_parallel_parse.py [lines ...]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_parse import best_of, make_document
+from diagram_parser import parse_diagram_data, parse_diagram_parallel
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [200000, 400000]
+    cpus = os.cpu_count() or 1
+    worker_counts = sorted({2, 4, cpus} - {1})
+    print(f"{cpus} CPUs")
+    print(f"{'lines':>8} {'workers':>8} {'seconds':>10} {'speedup':>8}")
+    for n in sizes:
+        doc = make_document(n)
+        serial = parse_diagram_data(doc)
+        t_serial = best_of(parse_diagram_data, doc)
+        print(f"{n:>8} {'serial':>8} {t_serial:>10.3f} {1:>7.2f}x")
+        for workers in worker_counts:
+            assert parse_diagram_parallel(doc, workers=workers) == serial, "parallel parse differs"
+            t = best_of(lambda text: parse_diagram_parallel(text, workers=workers), doc)
+            print(f"{n:>8} {workers:>8} {t:>10.3f} {t_serial / t:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
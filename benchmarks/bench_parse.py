@@ -0,0 +1,172 @@
+"""Parse-time benchmark: tokenizer-based parse_diagram_data vs. the previous
+regex/replace parser, which still classifies labels with the original
+add_icons if/elif chain. The "same icons" column runs the previous parser
+with today's memoized add_icons, so the last column is the gain of the
+single-pass tokenizer alone.
+
+Run from the repository root:  python benchmarks/bench_parse.py
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from diagram_keywords import classify_label
+from diagram_parser import _node_entry, add_icons, parse_diagram_data
+
+WORDS = ["User", "API Gateway", "Auth Service", "Database", "Cache Layer", "Order Service",
+         "Payment", "Email Notification", "Monitor", "Deploy", "Search Index", "Report"]
+
+def legacy_add_icons(label):
+    """The if/elif chain that classify_label() replaced."""
+    l = label.lower()
+    prefix = ""
+    if any(x in l for x in ["user", "actor", "client", "customer"]): prefix = "👤 "
+    elif any(x in l for x in ["db", "data", "sql", "store", "oracle", "database"]): prefix = "🛢️ "
+    elif any(x in l for x in ["cloud", "aws", "azure", "gcp"]): prefix = "☁️ "
+    elif any(x in l for x in ["api", "rest", "json", "endpoint", "service"]): prefix = "🔌 "
+    elif any(x in l for x in ["lock", "auth", "login", "security", "token"]): prefix = "🔒 "
+    elif any(x in l for x in ["email", "message", "notification", "alert"]): prefix = "📧 "
+    elif any(x in l for x in ["error", "fail", "404", "500", "exception"]): prefix = "⚠️ "
+    elif any(x in l for x in ["settings", "config", "setup", "configuration"]): prefix = "⚙️ "
+    elif any(x in l for x in ["file", "upload", "excel", "csv", "document"]): prefix = "📄 "
+    elif any(x in l for x in ["check", "validate", "success", "ok", "verified"]): prefix = "✅ "
+    elif any(x in l for x in ["web", "site", "dashboard", "ui", "interface"]): prefix = "🖥️ "
+    elif any(x in l for x in ["mobile", "app", "phone", "ios", "android"]): prefix = "📱 "
+    elif any(x in l for x in ["server", "host", "machine", "vm"]): prefix = "🖥️ "
+    elif any(x in l for x in ["network", "router", "switch", "gateway"]): prefix = "🌐 "
+    elif any(x in l for x in ["queue", "message", "broker", "kafka", "rabbit"]): prefix = "📬 "
+    elif any(x in l for x in ["cache", "redis", "memcached"]): prefix = "⚡ "
+    elif any(x in l for x in ["search", "elastic", "lucene"]): prefix = "🔍 "
+    elif any(x in l for x in ["payment", "transaction", "money", "billing"]): prefix = "💳 "
+    elif any(x in l for x in ["analytics", "report", "metrics", "stats"]): prefix = "📊 "
+    elif any(x in l for x in ["monitor", "log", "trace", "debug"]): prefix = "📈 "
+    elif any(x in l for x in ["deploy", "ci", "cd", "pipeline", "build"]): prefix = "🚀 "
+    elif any(x in l for x in ["test", "qa", "quality"]): prefix = "🧪 "
+    elif any(x in l for x in ["start", "begin", "init"]): prefix = "▶️ "
+    elif any(x in l for x in ["end", "finish", "complete", "done"]): prefix = "🏁 "
+    elif any(x in l for x in ["load", "balance", "distribute"]): prefix = "⚖️ "
+    elif any(x in l for x in ["sync", "replicate", "copy"]): prefix = "🔄 "
+    elif any(x in l for x in ["delete", "remove", "drop"]): prefix = "🗑️ "
+    elif any(x in l for x in ["add", "create", "insert", "new"]): prefix = "➕ "
+    elif any(x in l for x in ["update", "modify", "edit", "change"]): prefix = "✏️ "
+    elif any(x in l for x in ["read", "get", "fetch", "retrieve"]): prefix = "📖 "
+    elif any(x in l for x in ["write", "post", "put", "save"]): prefix = "✍️ "
+
+    return f"{prefix}{label}"
+
+def legacy_parse_diagram_data(text, icons=legacy_add_icons):
+    """The per-line multi-regex parser that parse_diagram_data replaced."""
+    lines = text.split('\n')
+    clusters = []
+    nodes = {}
+    edges = []
+    current_cluster = None
+    cluster_counter = 0
+    last_node_id_of_prev_line = None
+    connect_next_line = False
+    arrow_split_re = r'\s*(?:→|->|=>)\s*'
+    edge_label_re = r'\[([^\]]+)\]'
+
+    for line in lines:
+        line = line.strip()
+        if not line: continue
+
+        if line.startswith('#'):
+            title = line.lstrip('#').strip()
+            current_cluster = {'id': f'cluster_{cluster_counter}', 'title': title, 'nodes': set()}
+            clusters.append(current_cluster)
+            cluster_counter += 1
+            last_node_id_of_prev_line = None
+            connect_next_line = False
+            continue
+
+        clean_line_check = line.replace(" ", "")
+        if clean_line_check in ['↓', 'v', '|', '||']:
+            connect_next_line = True
+            continue
+
+        edge_labels = {}
+        for match in re.finditer(edge_label_re, line):
+            edge_labels[match.start()] = match.group(1)
+            line = line[:match.start()] + line[match.end():]
+
+        parts = re.split(arrow_split_re, line)
+        row_node_ids = []
+
+        for part in parts:
+            label = part.strip().replace("┌", "").replace("┐", "").replace("└", "").replace("┘", "").replace("│", "")
+            if label.endswith("↓"):
+                label = label[:-1].strip()
+                connect_next_line = True
+            if label.startswith("↓"):
+                label = label[1:].strip()
+                connect_next_line = True
+            if not label: continue
+
+            nid = re.sub(r'\W+', '_', label).strip('_')
+            if not nid: nid = f"node_{abs(hash(label))}"
+            nodes[nid] = icons(label)
+            row_node_ids.append(nid)
+            if current_cluster:
+                current_cluster['nodes'].add(nid)
+
+        if not row_node_ids: continue
+
+        if connect_next_line and last_node_id_of_prev_line:
+            edge_label = edge_labels.get(0, "") if edge_labels else ""
+            edges.append((last_node_id_of_prev_line, row_node_ids[0], edge_label))
+            connect_next_line = False
+
+        for i in range(len(row_node_ids) - 1):
+            edge_label = edge_labels.get(i, "") if edge_labels else ""
+            edges.append((row_node_ids[i], row_node_ids[i+1], edge_label))
+
+        last_node_id_of_prev_line = row_node_ids[-1]
+
+    return nodes, edges, clusters
+
+def make_document(n_lines, distinct_nodes=4800, block=40):
+    """Synthetic architecture dump with clusters, flows and ↓ connectors."""
+    out = []
+    k = 0
+    for i in range(n_lines):
+        if i % block == 0:
+            out.append(f"## Layer {i // block}")
+        elif i % 2 == 0:
+            out.append("↓")
+        else:
+            row = []
+            for _ in range(3):
+                row.append(f"{WORDS[k % len(WORDS)]} {k % distinct_nodes}")
+                k += 1
+            out.append(" → ".join(row))
+    return "\n".join(out)
+
+def best_of(fn, arg, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        _node_entry.cache_clear()  # time cold parses, not the label caches
+        classify_label.cache_clear()
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [12500, 25000, 50000, 100000]
+    print(f"{'lines':>8} {'legacy s':>10} {'same icons s':>13} {'lexer s':>10} {'speedup':>8}"
+          f" {'single pass':>12} {'lexer us/line':>14}")
+    for n in sizes:
+        doc = make_document(n)
+        assert parse_diagram_data(doc) == legacy_parse_diagram_data(doc), "parsers disagree"
+        t_old = best_of(legacy_parse_diagram_data, doc)
+        t_icons = best_of(lambda d: legacy_parse_diagram_data(d, add_icons), doc)
+        t_new = best_of(parse_diagram_data, doc)
+        print(f"{n:>8} {t_old:>10.3f} {t_icons:>13.3f} {t_new:>10.3f} {t_old / t_new:>7.2f}x"
+              f" {t_icons / t_new:>11.2f}x {t_new / n * 1e6:>14.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Remote-render client against a local stub of the quickchart.io service.
+
+The stub answers with a small SVG and can be slow or fail. check() first
+asserts the client's behaviour: retries on 5xx and 429 but not on other
+4xx, the per-request timeout, the circuit breaker opening after N failures and
+recovering through its half-open trial, and slot waits not counting as
+failures. Then three timed runs:
+
+  connections  bare requests.post per render vs. the pooled RemoteClient:
+               latency and TCP connections opened
+  flaky        every third response a 503: renders that still succeed
+               through retries, and the attempts that took
+  down         every response a 500: time per render once the circuit
+               breaker has opened, against the full retry cost before
+
+Run from the repository root:  python benchmarks/bench_remote_render.py [renders] [--delay SECONDS]
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from diagram_render import CircuitBreaker, QuickChartRenderer, RemoteClient
+
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg" width="10pt" height="10pt"></svg>'
+DOT = 'digraph G { a -> b }'
+
+class Stub(ThreadingHTTPServer):
+    """The service: `delay` seconds per response, and the first `fail_first`
+    responses plus every `fail_every`-th (0: none) with status `fail_status`."""
+    daemon_threads = True
+
+    def __init__(self, delay=0.0, fail_every=0, fail_status=503, fail_first=0):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.delay = delay
+        self.fail_every = fail_every
+        self.fail_status = fail_status
+        self.fail_first = fail_first
+        self.connections = 0
+        self.requests = itertools.count(1)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        super().__exit__(*exc)
+
+    def handle_error(self, request, client_address):
+        pass  # clients that timed out and hung up
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/graphviz"
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        n = next(self.server.requests)
+        time.sleep(self.server.delay)
+        fail = n <= self.server.fail_first or (self.server.fail_every and n % self.server.fail_every == 0)
+        body = b"error" if fail else SVG
+        self.send_response(self.server.fail_status if fail else 200)
+        self.send_header("Content-Type", "image/svg+xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def timed(fn, renders):
+    ok = 0
+    start = time.perf_counter()
+    for _ in range(renders):
+        try:
+            fn()
+            ok += 1
+        except RuntimeError:
+            pass
+    return (time.perf_counter() - start) / renders * 1000, ok
+
+def bare_post(url):
+    resp = requests.post(url, json={"graph": DOT, "format": "svg"}, timeout=5)
+    if resp.status_code != 200:
+        raise RuntimeError(f"Service returned status {resp.status_code}")
+
+def fails(fn):
+    try:
+        fn()
+    except RuntimeError as e:
+        return str(e)
+    raise AssertionError("expected a RuntimeError")
+
+def check():
+    # Retry on 5xx: two 503s, then the render succeeds on the third attempt
+    with Stub(fail_first=2) as stub:
+        client = RemoteClient(stub.url, retries=2, backoff=0.01)
+        assert QuickChartRenderer(client=client).render(DOT, "svg", 5).data == SVG
+        assert client.attempts == 3 and client.breaker.failed == 0
+
+    # 429 is retried like a 5xx
+    with Stub(fail_first=1, fail_status=429) as stub:
+        client = RemoteClient(stub.url, retries=2, backoff=0.01)
+        assert client.post({"graph": DOT}, 5) == SVG and client.attempts == 2
+
+    # No retry on other 4xx, and a rejected request does not count against the breaker
+    with Stub(fail_first=1, fail_status=400) as stub:
+        client = RemoteClient(stub.url, retries=2, backoff=0.01)
+        assert "400" in fails(lambda: client.post({"graph": DOT}, 5))
+        assert client.attempts == 1 and client.breaker.failed == 0
+
+    # Per-request timeout: a 2 s response is given up on after about 0.3 s
+    with Stub(delay=2.0) as stub:
+        client = RemoteClient(stub.url, retries=2, backoff=0.01)
+        start = time.monotonic()
+        fails(lambda: client.post({"graph": DOT}, 0.3))
+        assert time.monotonic() - start < 1.0
+
+    # The breaker opens after 3 failed calls; then calls fail without a request
+    with Stub(fail_every=1, fail_status=500) as stub:
+        client = RemoteClient(stub.url, retries=0, breaker=CircuitBreaker(failures=3, reset_after=0.3))
+        renderer = QuickChartRenderer(client=client)
+        for n in range(3):
+            assert client.breaker.state == "closed"
+            fails(lambda: renderer.render(DOT, "svg", 5))
+        assert client.breaker.state == "open" and not renderer.available()
+        assert "unavailable" in fails(lambda: renderer.render(DOT, "svg", 5))
+        assert client.attempts == 3
+
+        # Half-open: one trial call; a failing trial opens the breaker again
+        time.sleep(0.35)
+        assert client.breaker.state == "half-open" and renderer.available()
+        fails(lambda: renderer.render(DOT, "svg", 5))
+        assert client.attempts == 4 and client.breaker.state == "open"
+
+        # A successful trial closes it
+        time.sleep(0.35)
+        stub.fail_every = 0
+        assert renderer.render(DOT, "svg", 5).data == SVG
+        assert client.breaker.state == "closed" and client.breaker.failed == 0
+
+    # Waiting for a free connection is local load and does not trip the breaker
+    with Stub(delay=0.5) as stub:
+        client = RemoteClient(stub.url, max_connections=1, breaker=CircuitBreaker(failures=1))
+        busy = threading.Thread(target=client.post, args=({"graph": DOT}, 5))
+        busy.start()
+        time.sleep(0.1)
+        assert "No free connection" in fails(lambda: client.post({"graph": DOT}, 0.1))
+        assert client.breaker.state == "closed"  # before the busy call's success resets it
+        busy.join()
+    print("checks passed")
+
+def main():
+    args = sys.argv[1:]
+    delay = 0.0
+    if "--delay" in args:
+        i = args.index("--delay")
+        delay = float(args[i + 1])
+        del args[i:i + 2]
+    renders = int(args[0]) if args else 200
+    check()
+
+    print(f"{'run':<22} {'ms/render':>10} {'ok':>6} {'connections':>12} {'attempts':>9}")
+    stub = Stub(delay)
+    ms, ok = timed(lambda: bare_post(stub.url), renders)
+    print(f"{'bare requests.post':<22} {ms:>10.2f} {ok:>6} {stub.connections:>12} {renders:>9}")
+    stub.connections = 0
+    renderer = QuickChartRenderer(client=RemoteClient(stub.url))
+    ms, ok = timed(lambda: renderer.render(DOT, "svg", 5), renders)
+    print(f"{'pooled client':<22} {ms:>10.2f} {ok:>6} {stub.connections:>12} {renderer.client.attempts:>9}")
+    stub.shutdown()
+
+    stub = Stub(delay, fail_every=3)
+    renderer = QuickChartRenderer(client=RemoteClient(stub.url, backoff=0.01))
+    ms, ok = timed(lambda: renderer.render(DOT, "svg", 5), renders)
+    print(f"{'flaky, retried':<22} {ms:>10.2f} {ok:>6} {stub.connections:>12} {renderer.client.attempts:>9}")
+    stub.shutdown()
+
+    stub = Stub(delay, fail_every=1, fail_status=500)
+    client = RemoteClient(stub.url, backoff=0.05, breaker=CircuitBreaker(failures=3, reset_after=60))
+    renderer = QuickChartRenderer(client=client)
+    ms, ok = timed(lambda: renderer.render(DOT, "svg", 5), 3)
+    print(f"{'down, breaker closed':<22} {ms:>10.2f} {ok:>6} {stub.connections:>12} {client.attempts:>9}")
+    ms, ok = timed(lambda: renderer.render(DOT, "svg", 5), renders)
+    print(f"{'down, breaker open':<22} {ms:>10.2f} {ok:>6} {stub.connections:>12} {client.attempts:>9}"
+          f"   ({client.breaker.state})")
+    stub.shutdown()
+
+if __name__ == "__main__":
+    main()
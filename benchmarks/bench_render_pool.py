@@ -0,0 +1,44 @@
+"""Render-latency benchmark: a Graphviz process per render vs. the warm
+workers of a LayoutPool, over many small diagrams (the cost of a rerun).
+Needs a local Graphviz.
+
+Run from the repository root:  python benchmarks/bench_render_pool.py [--dot PATH] [renders]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_parse import make_document
+from diagram_export import generate_dot_code
+from diagram_graph import DiagramGraph
+from diagram_parser import parse_diagram_data
+from diagram_render import LayoutPool, LocalRenderer
+from diagram_themes import THEMES
+
+def timed_renders(renderer, dots):
+    start = time.perf_counter()
+    for dot in dots:
+        renderer.render(dot, "svg")
+    return (time.perf_counter() - start) / len(dots)
+
+def main():
+    args = sys.argv[1:]
+    command = "dot"
+    if args[:1] == ["--dot"]:
+        command, args = args[1], args[2:]
+    renders = int(args[0]) if args else 50
+    theme = next(iter(THEMES))
+    dots = [generate_dot_code(DiagramGraph.from_parts(*parse_diagram_data(make_document(10 + i % 5))), theme, compact=True)
+            for i in range(renders)]
+
+    cold = timed_renders(LocalRenderer(command=command), dots)
+    pool = LayoutPool(LocalRenderer(command=command, warm=True), workers=1)
+    pool.render(dots[0], "svg")  # start the worker's process
+    warm = timed_renders(pool, dots)
+    print(f"{'renders':>8} {'cold ms':>9} {'warm ms':>9} {'speedup':>8}")
+    print(f"{renders:>8} {cold * 1000:>9.2f} {warm * 1000:>9.2f} {cold / warm:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
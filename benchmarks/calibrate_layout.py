@@ -0,0 +1,92 @@
+"""Calibrates the layout cost model in diagram_layout.py against a local
+Graphviz installation.
+
+Lays out generated diagrams of growing size with every engine (straight
+lines, no clusters), then with each spline style and with clusters on
+`dot`, and prints fitted ENGINE_COST, SPLINE_FACTOR and CLUSTER_COST
+values to paste into diagram_layout.py.
+
+Run from the repository root:  python benchmarks/calibrate_layout.py [--dot PATH] [lines ...]
+"""
+import math
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_parse import make_document
+from diagram_export import render_dot
+from diagram_graph import DiagramGraph
+from diagram_layout import BASE_SECONDS, ENGINE_COST, SPLINE_FACTOR, LayoutPlan, layout_size
+from diagram_parser import parse_diagram_data
+from diagram_themes import THEMES
+
+THEME = next(iter(THEMES))
+
+def layout_seconds(graph, command, engine, splines, use_clusters):
+    plan = LayoutPlan(engine, splines, use_clusters, 0, ())
+    start = time.perf_counter()
+    render_dot(graph, THEME, compact=True, layout_plan=plan, command=command)
+    return time.perf_counter() - start
+
+def fit_power(points):
+    """(scale, exponent) of seconds = scale * work ** exponent, least squares in log-log."""
+    xs = [math.log(w) for w, _ in points]
+    ys = [math.log(max(t, 1e-4)) for _, t in points]
+    mx, my = statistics.fmean(xs), statistics.fmean(ys)
+    var = sum((x - mx) ** 2 for x in xs)
+    exponent = sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var if var else 1.0
+    return math.exp(my - exponent * mx), exponent
+
+def main():
+    args = sys.argv[1:]
+    command = "dot"
+    if args[:1] == ["--dot"]:
+        command, args = args[1], args[2:]
+    sizes = [int(a) for a in args] or [50, 100, 200, 400]
+
+    graphs = []
+    for n in sizes:
+        graph = DiagramGraph.from_parts(*parse_diagram_data(make_document(n, distinct_nodes=n * 3)))
+        nodes, edges, clusters, chars = layout_size(graph)
+        graphs.append((graph, (nodes + edges + chars / 100) / 1000, clusters))
+
+    engine_cost = {}
+    for engine in ENGINE_COST:
+        points = []
+        for graph, work, _ in graphs:
+            seconds = layout_seconds(graph, command, engine, "line", False) - BASE_SECONDS
+            points.append((work, seconds))
+            print(f"{engine:>6} {graph.node_count:>6} nodes  {seconds + BASE_SECONDS:8.3f} s", file=sys.stderr)
+        engine_cost[engine] = fit_power(points)
+
+    spline_factor = {"line": 1.0}
+    for splines in SPLINE_FACTOR:
+        if splines == "line":
+            continue
+        ratios = []
+        for graph, _, _ in graphs:
+            base = layout_seconds(graph, command, "dot", "line", False)
+            ratios.append(layout_seconds(graph, command, "dot", splines, False) / base)
+        spline_factor[splines] = statistics.median(ratios)
+
+    per_cluster = []
+    for graph, _, clusters in graphs:
+        base = layout_seconds(graph, command, "dot", "line", False)
+        with_clusters = layout_seconds(graph, command, "dot", "line", True)
+        per_cluster.append((with_clusters / base - 1) / max(clusters, 1))
+
+    print("ENGINE_COST = {")
+    for engine, (scale, exponent) in engine_cost.items():
+        print(f'    "{engine}": ({scale:.3g}, {exponent:.2f}),')
+    print("}")
+    print("SPLINE_FACTOR = {")
+    for splines, factor in spline_factor.items():
+        print(f'    "{splines}": {factor:.2f},')
+    print("}")
+    print(f"CLUSTER_COST = {max(statistics.median(per_cluster), 0):.3g}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Batch compiler: turns many diagram source files into DOT / draw.io / JSON.
+
+    python diagram_batch.py docs/diagrams -o build/diagrams --formats dot,drawio
+
+Files are spread over a process pool; each worker streams its source with
+iter_parse(), writes its outputs straight into the output directory and
+reports back only a small result dict, so throughput scales with cores.
+'!include <module>' lines are resolved against the source's directory
+(<module> or <module>.txt).
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from diagram_export import export_to_json, generate_drawio_xml, write_dot
+from diagram_graph import EDGE_MERGE_MODES, DiagramGraph, merge_edges
+from diagram_parser import format_diagnostic, iter_parse, parse_diagram_modules
+from diagram_themes import THEMES
+
+FORMATS = {
+    "dot": ".dot",
+    "drawio": ".drawio",
+    "json": ".json",
+}
+
+DEFAULT_THEME = next(iter(THEMES))
+
+def compile_file(source, dest_stem, formats=("dot", "drawio", "json"), theme_name=DEFAULT_THEME,
+                 layout_engine="dot", splines="ortho", visualization_mode="flow", canonical=False, compact=False,
+                 edge_merge="keep"):
+    """Compiles one source file; outputs are written as dest_stem + extension.
+
+    Returns {source, outputs, nodes, edges, seconds, error}. Errors are
+    reported in the result rather than raised, so one bad file does not stop
+    a batch.
+    """
+    start = time.perf_counter()
+    result = {"source": str(source), "outputs": [], "nodes": 0, "edges": 0, "seconds": 0.0, "error": None}
+    try:
+        with open(source, 'rb') as f:
+            includes = _has_includes(f)
+            f.seek(0)
+            if not includes:
+                graph = DiagramGraph.from_events(iter_parse(f, canonical=canonical))
+        if includes:
+            graph = _parse_with_includes(Path(source), canonical)
+        graph = merge_edges(graph, edge_merge)
+        result["nodes"] = graph.node_count
+        result["edges"] = graph.edge_count
+
+        dest_stem = Path(dest_stem)
+        dest_stem.parent.mkdir(parents=True, exist_ok=True)
+        for fmt in formats:
+            if fmt not in FORMATS:
+                raise ValueError(f"Unknown output format: {fmt}")
+            out_path = dest_stem.with_name(dest_stem.name + FORMATS[fmt])
+            if fmt == "dot":
+                # Streamed, so large graphs never hold the whole DOT text
+                with open(out_path, 'wb') as f:
+                    write_dot(f, graph, theme_name, layout_engine, splines, visualization_mode, compact=compact)
+            elif fmt == "drawio":
+                out_path.write_text(generate_drawio_xml(graph, canonical), encoding='utf-8')
+            else:
+                out_path.write_text(export_to_json(graph, canonical), encoding='utf-8')
+            result["outputs"].append(str(out_path))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def _has_includes(f, chunk_size=1 << 16):
+    tail = b''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return False
+        if b'!include' in tail + chunk:
+            return True
+        tail = chunk[-7:]
+
+def _parse_with_includes(source, canonical):
+    """Parses a source that includes modules; any error diagnostic (such as
+    a missing module) fails the file."""
+    base = source.parent
+
+    def load_module(name):
+        for path in (base / name, base / (name + '.txt')):
+            if path.is_file():
+                return path.read_text(encoding='utf-8')
+        return None
+
+    nodes, edges, clusters, errors, _ = parse_diagram_modules(source.read_text(encoding='utf-8'), load_module, {}, canonical)
+    if errors:
+        raise ValueError("; ".join(map(format_diagnostic, errors)))
+    return DiagramGraph.from_parts(nodes, edges, clusters)
+
+def _dest_stem(source, out_dir, root):
+    rel = source.relative_to(root) if root is not None else Path(source.name)
+    return Path(out_dir) / rel.with_suffix('')
+
+def compile_batch(sources, out_dir, root=None, workers=None, **options):
+    """Compiles `sources` in a process pool and yields results as they finish.
+
+    Output paths mirror each source's path relative to `root` (or just its
+    file name) under `out_dir`. `options` are passed on to compile_file().
+    With workers=1 everything runs in this process.
+    """
+    root = Path(root) if root is not None else None
+    jobs = [(Path(s), _dest_stem(Path(s), out_dir, root)) for s in sources]
+    return _run_jobs(jobs, workers, options)
+
+def _run_jobs(jobs, workers, options):
+    if workers == 1 or len(jobs) <= 1:
+        for source, dest in jobs:
+            yield compile_file(source, dest, **options)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(compile_file, source, dest, **options) for source, dest in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+def find_sources(paths, pattern="*.txt"):
+    """Expands directories (recursively, by `pattern`) into (file, root) pairs."""
+    found = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            found.extend((f, p) for f in sorted(p.rglob(pattern)) if f.is_file())
+        else:
+            found.append((p, None))
+    return found
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile diagram source files in parallel.")
+    parser.add_argument("paths", nargs="+", help="source files or directories")
+    parser.add_argument("-o", "--out-dir", default="diagram_out", help="output directory (default: diagram_out)")
+    parser.add_argument("--formats", default="dot,drawio,json", help="comma-separated: " + ", ".join(FORMATS))
+    parser.add_argument("--pattern", default="*.txt", help="file pattern used inside directories (default: *.txt)")
+    parser.add_argument("--theme", default=DEFAULT_THEME, choices=list(THEMES), help="theme for DOT output")
+    parser.add_argument("--mode", default="flow", choices=["flow", "sequence", "mindmap", "network"], help="visualization mode")
+    parser.add_argument("--canonical", action="store_true", help="byte-stable output (see parse_diagram_data)")
+    parser.add_argument("--compact", action="store_true", help="compact DOT with per-type node defaults")
+    parser.add_argument("--merge-edges", default="keep", choices=EDGE_MERGE_MODES,
+                        help="merge repeated edges into one counted edge (default: keep)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown:
+        parser.error("unknown format(s): " + ", ".join(unknown))
+
+    # Files found inside a directory keep their layout relative to it
+    jobs = [(source, _dest_stem(source, args.out_dir, root)) for source, root in find_sources(args.paths, args.pattern)]
+    options = dict(formats=formats, theme_name=args.theme, visualization_mode=args.mode, canonical=args.canonical,
+                   compact=args.compact, edge_merge=args.merge_edges)
+
+    start = time.perf_counter()
+    total = failed = 0
+    for result in _run_jobs(jobs, args.workers, options):
+        total += 1
+        if result["error"]:
+            failed += 1
+            print(f"FAIL {result['source']} ({result['seconds'] * 1000:.1f} ms): {result['error']}", file=sys.stderr)
+        else:
+            print(f"ok   {result['source']} ({result['seconds'] * 1000:.1f} ms, "
+                  f"{result['nodes']} nodes, {result['edges']} edges)")
+    elapsed = time.perf_counter() - start
+    print(f"{total - failed}/{total} files compiled in {elapsed:.2f} s with {args.workers or os.cpu_count()} workers")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Content-addressed on-disk cache for rendered artifacts, shared by processes.
+
+    cache = DiskCache("~/.cache/diagrams", max_bytes=256 << 20)
+    key = cache_key(dot_digest, "svg")
+    data = cache.get(key)
+    if data is None:
+        data = cache.put(key, render(...))
+
+An entry is one file named by its key under a two-character fan-out
+directory. Writes go to a temporary file that is renamed into place, so
+readers in any process see a whole entry or none. A hit refreshes the
+file's modification time, and eviction removes the least recently used
+files until the cache is back under its size limit; it runs under a lock
+file where the platform has fcntl, and readers treat a file evicted under
+them as a miss. Entries can be stored zlib-compressed; each file records
+whether it is, so processes with different settings share one cache.
+"""
+import os
+import re
+import tempfile
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: eviction runs unlocked, which is still safe
+    fcntl = None
+
+_KEY_RE = re.compile(r'^[0-9A-Za-z][0-9A-Za-z_.-]*$')
+
+_RAW, _ZLIB = b'R', b'Z'
+
+def cache_key(digest, *parts):
+    """Key for an artifact of the content with hex `digest`, such as
+    cache_key(md5_of_dot, "png", 300)."""
+    return '-'.join([digest, *(str(p) for p in parts if p is not None)])
+
+class DiskCache:
+    """Bounded LRU of bytes in files under `root`.
+
+    `max_bytes` bounds the total size; eviction trims to `low_water` of it.
+    With `compress` (a zlib level, 0 for off) entries are stored compressed
+    when that makes them smaller. The directory size is rescanned at most
+    every `scan_every` writes, so a put is usually just the write.
+    """
+
+    def __init__(self, root, max_bytes=256 << 20, compress=6, low_water=0.9, scan_every=64):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.low_water = low_water
+        self.scan_every = scan_every
+        self.size = None  # estimated bytes on disk, None until scanned
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        if not _KEY_RE.match(key):
+            raise ValueError(f"Invalid cache key: {key!r}")
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        """The bytes stored under `key`, or None."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)  # most recently used
+        except OSError:
+            pass  # evicted meanwhile; the data read is still good
+        if blob[:1] == _ZLIB:
+            data = zlib.decompress(blob[1:])
+        elif blob[:1] == _RAW:
+            data = blob[1:]
+        else:  # not written by us; drop it
+            self.discard(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Stores `data` under `key` atomically and returns it."""
+        path = self.path(key)
+        blob = _RAW + data
+        if self.compress:
+            packed = zlib.compress(data, self.compress)
+            if len(packed) < len(data):
+                blob = _ZLIB + packed
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self.writes += 1
+        if self.size is not None:
+            self.size += len(blob)
+        if self.size is None or self.size > self.max_bytes or self.writes % self.scan_every == 0:
+            self.evict()
+        return data
+
+    def discard(self, key):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def _entries(self, stale_after=3600):
+        # (mtime, size, path) of every entry; files may vanish while we look.
+        # Temporary files left by a writer that died are removed.
+        now = time.time()
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                try:
+                    stat = entry.stat()
+                    if entry.name.startswith('.tmp-'):
+                        if now - stat.st_mtime > stale_after:
+                            os.unlink(entry.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, entry.path
+
+    def evict(self):
+        """Removes least recently used entries until the cache is under
+        low_water * max_bytes, if it is over max_bytes."""
+        with _Lock(os.path.join(self.root, '.lock')):
+            entries = sorted(self._entries())
+            size = sum(e[1] for e in entries)
+            if size > self.max_bytes:
+                target = self.max_bytes * self.low_water
+                for _, file_size, path in entries:
+                    if size <= target:
+                        break
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                    size -= file_size
+            self.size = size
+
+    def clear(self):
+        with _Lock(os.path.join(self.root, '.lock')):
+            for _, _, path in list(self._entries()):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            self.size = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "writes": self.writes, "bytes": self.size}
+
+class _Lock:
+    """Exclusive lock on a file across processes (a no-op without fcntl)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.file = open(self.path, 'a')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+        return False
@@ -0,0 +1,594 @@
+import hashlib
+import html
+import json
+import math
+import os
+import re
+import subprocess
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import chain
+
+from diagram_graph import DiagramGraph
+from diagram_layout import LayoutPlan, component_batches, resolve_layout
+from diagram_themes import DRAWIO_STYLES, THEMES, get_node_type, graphviz_style_row
+
+def generate_dot_code(graph, theme_name, layout_engine="dot", splines="ortho", visualization_mode="flow", collapsed_clusters=None, compact=False, fragment_cache=None, layout_plan=None, proxy_sizes=None):
+    """
+    Generate Graphviz DOT code with enhanced visualization modes from a DiagramGraph.
+    """
+    return "\n".join(iter_dot_lines(graph, theme_name, layout_engine, splines, visualization_mode, collapsed_clusters, compact, fragment_cache, layout_plan, proxy_sizes))
+
+def iter_dot_lines(graph, theme_name, layout_engine="dot", splines="ortho", visualization_mode="flow", collapsed_clusters=None, compact=False, fragment_cache=None, layout_plan=None, proxy_sizes=None):
+    """
+    The lines of generate_dot_code(), produced one at a time.
+
+    With compact=True a node type's style is declared once as a `node [...]`
+    default whenever the type changes within a scope (the graph or a
+    cluster), and node lines carry only the label. Node order, and so the
+    layout, is the same as in the full output.
+
+    A collapsed cluster is drawn as one proxy node standing in for its
+    members. Edges to or from members are rerouted to the proxy and merged:
+    parallel edges become one edge labelled with their count, weighted and
+    thickened by it, and edges inside a collapsed cluster are dropped. Only
+    the visible structure reaches the layout engine. An edge of weight n > 1
+    (see DiagramGraph.aggregate_edges()) is drawn the same way, with its
+    label followed by "×n".
+
+    With a DotFragmentCache, cluster bodies are reused from earlier calls
+    and only new or edited clusters are generated (a cached body is yielded
+    as one multi-line string).
+
+    A LayoutPlan from diagram_layout.plan_layout() overrides the engine,
+    splines and cluster drawing picked from the layout choices.
+
+    `proxy_sizes` maps collapsed cluster ids to a (width, height) in points;
+    those proxies become blank boxes of that size, as placeholders for
+    drawings laid out separately (see render_hierarchical()).
+    """
+    if collapsed_clusters is None:
+        collapsed_clusters = set()
+
+    theme = THEMES[theme_name]
+
+    # Engine, splines and clusters follow the layout choices, or a
+    # plan_layout() result that may have downgraded them
+    if layout_plan is None:
+        engine, splines_val, use_clusters = resolve_layout(layout_engine, splines, visualization_mode)
+    else:
+        engine, splines_val, use_clusters = layout_plan.engine, layout_plan.splines, layout_plan.use_clusters
+    if engine == 'dot':
+        rankdir_str = 'rankdir=LR;' if visualization_mode == "sequence" else 'rankdir=TB;'
+    else:
+        rankdir_str = ''
+
+    # Enhanced styling based on visualization mode
+    node_penwidth = 2.0 if visualization_mode in ["network", "mindmap"] else 1.5
+    edge_penwidth = 1.5 if visualization_mode == "sequence" else 1.0
+
+    yield from [
+        'digraph G {',
+        f'  layout={engine};',
+        f'  {rankdir_str}',
+        f'  bgcolor="transparent";',
+        f'  splines={splines_val};',
+        '  overlap=false;',
+        f'  nodesep={0.8 if visualization_mode == "mindmap" else 0.6};',
+        f'  ranksep={1.2 if visualization_mode == "mindmap" else 0.8};',
+        f'  node [fontname="{theme["font"]}", fontsize={12 if visualization_mode == "mindmap" else 10}, penwidth={node_penwidth}];',
+        f'  edge [fontname="{theme["font"]}", fontsize=9, color="{theme["edge_color"]}", arrowsize=0.8, penwidth={edge_penwidth}];'
+    ]
+
+    def escape_label(s): return s.replace('"', '\\"')
+
+    node_ids, labels = graph.node_ids, graph.labels
+    node_styles = graphviz_style_row(theme_name, visualization_mode)
+    rendered_nodes = bytearray(graph.node_count)
+
+    def node_lines(i, indent, scope_type):
+        # Lines for node i, and the node type whose defaults are then in scope
+        node_type = get_node_type(labels[i])
+        if not compact:
+            return (f'{indent}{node_ids[i]} [label="{escape_label(labels[i])}", {node_styles[node_type]}];',), scope_type
+        line = f'{indent}{node_ids[i]} [label="{escape_label(labels[i])}"];'
+        if node_type != scope_type:
+            return (f'{indent}node [{node_styles[node_type]}];', line), node_type
+        return (line,), node_type
+
+    # hidden[i] is the collapsed cluster that node i is folded into, or -1
+    collapsed = [k for k, cluster_id in enumerate(graph.cluster_ids) if cluster_id in collapsed_clusters]
+    hidden = array('i', [-1]) * graph.node_count
+    for k in collapsed:
+        for i in graph.cluster_nodes(k):
+            if hidden[i] < 0:
+                hidden[i] = k
+    proxy_ids = {k: f'{graph.cluster_ids[k]}_collapsed' for k in collapsed}
+
+    def proxy_line(k, indent):
+        size = (proxy_sizes or {}).get(graph.cluster_ids[k])
+        if size:
+            return (f'{indent}{proxy_ids[k]} [label="", shape="box", style="solid", color="transparent", '
+                    f'fixedsize=true, width={size[0] / 72:.3f}, height={size[1] / 72:.3f}];')
+        d = theme["default"]
+        return (f'{indent}{proxy_ids[k]} [label="{escape_label(graph.cluster_titles[k])}\\n({len(graph.cluster_nodes(k))} nodes)", '
+                f'shape="folder", style="filled,bold", fillcolor="{d["fill"]}", color="{theme["edge_color"]}", fontcolor="{d["text"]}"];')
+
+    def cluster_body(k, is_collapsed, members):
+        # A collapsed cluster's proxy node is not part of its body: the
+        # proxy id is positional, so it stays out of the fragment cache
+        title = graph.cluster_titles[k]
+        if is_collapsed:
+            yield f'    label="{escape_label(title)} [Collapsed]";'
+            yield f'    style="rounded,dashed,filled";'
+            yield f'    fillcolor="{theme["default"]["fill"]}";'
+            return
+        yield f'    label="{escape_label(title)}";'
+        yield f'    style="rounded,dashed";'
+        yield f'    color="{theme["edge_color"]}";'
+        yield f'    fontcolor="{theme["edge_color"]}";'
+        scope_type = None
+        for i in members:
+            lines, scope_type = node_lines(i, '    ', scope_type)
+            yield from lines
+
+    if use_clusters:
+        for k, cluster_id in enumerate(graph.cluster_ids):
+            is_collapsed = cluster_id in collapsed_clusters
+            members = graph.cluster_nodes(k)
+            if collapsed and not is_collapsed:
+                members = [i for i in members if hidden[i] < 0]
+
+            yield f'  subgraph {cluster_id} {{'
+            if fragment_cache is None:
+                yield from cluster_body(k, is_collapsed, members)
+            else:
+                # A cluster's body depends only on its title, members and the
+                # style parameters, not on its position or id
+                key = hashlib.md5('\0'.join(chain(
+                    (theme_name, visualization_mode, str(compact), str(is_collapsed), graph.cluster_titles[k]),
+                    () if is_collapsed else chain.from_iterable((node_ids[i], labels[i]) for i in members),
+                )).encode('utf-8')).digest()
+                body = fragment_cache.get(key)
+                if body is None:
+                    body = fragment_cache.put(key, '\n'.join(cluster_body(k, is_collapsed, members)))
+                yield body
+            if is_collapsed:
+                yield proxy_line(k, '    ')
+            else:
+                for i in members:
+                    rendered_nodes[i] = 1
+            yield '  }'
+
+    else:
+        for k in collapsed:
+            yield proxy_line(k, '    ')
+
+    scope_type = None
+    for i in range(graph.node_count):
+        if not rendered_nodes[i] and hidden[i] < 0:
+            lines, scope_type = node_lines(i, '    ', scope_type)
+            yield from lines
+
+    edge_style = 'style="dashed"' if visualization_mode == "sequence" else ''
+    strings = graph.strings
+
+    def edge_line(src, dst, l, n=1):
+        if n > 1:  # Merged repeats
+            label = f'{escape_label(strings[l])} ×{n}' if l else f'×{n}'
+            return (f'    {src} -> {dst} [label="{label}", weight={n}, '
+                    f'penwidth={edge_penwidth * (1 + math.log2(n)):.2f} {edge_style}];')
+        if l:  # Has label
+            return f'    {src} -> {dst} [label="{escape_label(strings[l])}" {edge_style}];'
+        return f'    {src} -> {dst} [{edge_style}];'
+
+    if not collapsed:
+        for s, d, l, n in zip(graph.edge_src, graph.edge_dst, graph.edge_label, graph.edge_weight):
+            yield edge_line(node_ids[s], node_ids[d], l, n)
+    else:
+        def endpoint(i):
+            return node_ids[i] if hidden[i] < 0 else proxy_ids[hidden[i]]
+
+        # Count the rerouted edges per (src, dst) first, then emit each
+        # merged edge where its first member edge was
+        counts = {}
+        for s, d, n in zip(graph.edge_src, graph.edge_dst, graph.edge_weight):
+            if hidden[s] >= 0 or hidden[d] >= 0:
+                pair = (endpoint(s), endpoint(d))
+                counts[pair] = counts.get(pair, 0) + n
+        for s, d, l, w in zip(graph.edge_src, graph.edge_dst, graph.edge_label, graph.edge_weight):
+            if hidden[s] < 0 and hidden[d] < 0:
+                yield edge_line(node_ids[s], node_ids[d], l, w)
+                continue
+            src, dst = endpoint(s), endpoint(d)
+            n = counts.pop((src, dst), 0)
+            if src == dst or not n:
+                continue  # inside one collapsed cluster, or already merged
+            if n == w:  # the only edge rerouted between these two
+                yield edge_line(src, dst, l, n)
+            else:
+                yield (f'    {src} -> {dst} [label="{n} edges", weight={n}, '
+                       f'penwidth={edge_penwidth * (1 + math.log2(n)):.2f} {edge_style}];')
+
+    yield '}'
+
+class DotFragmentCache:
+    """Bounded LRU of generated cluster bodies for generate_dot_code(), or
+    of cluster drawings for render_hierarchical()."""
+    __slots__ = ('maxsize', 'fragments', 'hits', 'misses')
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.fragments = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        body = self.fragments.get(key)
+        if body is None:
+            self.misses += 1
+        else:
+            self.fragments.move_to_end(key)
+            self.hits += 1
+        return body
+
+    def put(self, key, body):
+        self.fragments[key] = body
+        if len(self.fragments) > self.maxsize:
+            self.fragments.popitem(last=False)
+        return body
+
+def write_dot(sink, graph, theme_name, *args, chunk_size=1 << 16, **kwargs):
+    """Streams the DOT of generate_dot_code() into `sink` as UTF-8 bytes.
+
+    `sink` is anything with write(bytes), such as a binary file or a
+    subprocess's stdin, or update(bytes), such as a hashlib object. The
+    text goes out in chunks of about `chunk_size` characters and is hashed
+    on the way, so the full DOT string is never built. Returns (md5
+    hexdigest, bytes written); the digest is that of generate_dot_code().
+    """
+    write = getattr(sink, 'write', None) or sink.update
+    digest = hashlib.md5()
+    size = 0
+    buffer = []
+    buffered = 0
+    separator = ''
+    for line in iter_dot_lines(graph, theme_name, *args, **kwargs):
+        buffer.append(separator)
+        buffer.append(line)
+        buffered += len(line) + 1
+        separator = '\n'
+        if buffered >= chunk_size:
+            data = ''.join(buffer).encode('utf-8')
+            digest.update(data)
+            write(data)
+            size += len(data)
+            buffer = []
+            buffered = 0
+    data = ''.join(buffer).encode('utf-8')
+    digest.update(data)
+    write(data)
+    return digest.hexdigest(), size + len(data)
+
+def render_dot(graph, theme_name, *args, output_format="svg", command="dot", **kwargs):
+    """Lays out the graph with a local Graphviz process, piping the DOT into
+    its stdin as it is generated (see write_dot()).
+
+    The `layout=` statement in the DOT picks the engine. Returns (output
+    bytes, DOT md5 hexdigest). Raises RuntimeError if Graphviz fails and
+    OSError if `command` cannot be started.
+    """
+    return pipe_graphviz(command, output_format,
+                         lambda stdin: write_dot(stdin, graph, theme_name, *args, **kwargs)[0])
+
+def pipe_graphviz(command, output_format, feed, timeout=None):
+    """Runs Graphviz `command` with -T`output_format`; feed(stdin) writes
+    the DOT and returns something not None (such as its digest).
+
+    Returns (output bytes, what feed returned). Raises RuntimeError if the
+    process fails or runs longer than `timeout` seconds.
+    """
+    proc = subprocess.Popen([command, f"-T{output_format}"], stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # Drain stdout/stderr while writing, so a full pipe cannot block us
+    out, err = [], []
+    readers = [threading.Thread(target=lambda f=f, into=into: into.append(f.read()), daemon=True)
+               for f, into in ((proc.stdout, out), (proc.stderr, err))]
+    for reader in readers:
+        reader.start()
+    try:
+        digest = feed(proc.stdin)
+        proc.stdin.close()
+    except BrokenPipeError:
+        digest = None  # the process exited early; its stderr says why
+    try:
+        proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        raise RuntimeError(f"{command} timed out after {timeout} s")
+    for reader in readers:
+        reader.join()
+    if proc.returncode != 0 or digest is None:
+        message = err[0].decode('utf-8', 'replace').strip() if err else ""
+        raise RuntimeError(f"{command} exited with status {proc.returncode}: {message}")
+    return out[0], digest
+
+def render_components(graph, theme_name, *args, workers=None, command="dot", **kwargs):
+    """SVG of the graph with its connected components laid out in parallel.
+
+    Components are grouped into up to `workers` batches (default: one per
+    CPU, see diagram_layout.component_batches()), each batch is laid out by
+    its own Graphviz process, and the SVGs are packed into one like gvpack
+    does (see pack_svgs()). Other arguments are those of render_dot().
+    Returns (SVG bytes, md5 hexdigest of the batch DOTs).
+    """
+    batches = component_batches(graph, workers or os.cpu_count() or 1)
+    if len(batches) == 1:
+        return render_dot(graph, theme_name, *args, command=command, **kwargs)
+    # The DOT is generated here; only the layouts run concurrently
+    dots = [generate_dot_code(graph.subgraph(nodes), theme_name, *args, **kwargs).encode('utf-8')
+            for nodes in batches]
+    with ThreadPoolExecutor(len(dots)) as pool:
+        svgs = list(pool.map(lambda dot: pipe_graphviz(command, "svg", lambda stdin: stdin.write(dot))[0], dots))
+    digest = hashlib.md5(b'\0'.join(dots)).hexdigest()
+    return pack_svgs(svgs).encode('utf-8'), digest
+
+_SVG_ROOT_RE = re.compile(r'<svg\b([^>]*)>')
+_SVG_REF_RE = re.compile(r'(\bid="|url\(#|href="#)')
+
+def _svg_length(attrs, name):
+    match = re.search(rf'\b{name}="([\d.]+)', attrs)
+    return float(match.group(1)) if match else 0.0
+
+def _split_svg(svg, prefix):
+    """(width, height, viewBox, inner markup) of an SVG document, with its
+    element ids and references to them prefixed by `prefix`."""
+    if isinstance(svg, bytes):
+        svg = svg.decode('utf-8')
+    root = _SVG_ROOT_RE.search(svg)
+    attrs = root.group(1)
+    viewbox = re.search(r'viewBox="([^"]*)"', attrs)
+    if viewbox:
+        w, h = [float(v) for v in viewbox.group(1).replace(',', ' ').split()[2:4]]
+        viewbox = viewbox.group(1)
+    else:
+        w, h = _svg_length(attrs, 'width'), _svg_length(attrs, 'height')
+        viewbox = f"0 0 {w:g} {h:g}"
+    body = _SVG_REF_RE.sub(rf'\g<1>{prefix}', svg[root.end():svg.rindex('</svg>')])
+    return w, h, viewbox, body
+
+def pack_svgs(svgs, gap=16):
+    """One SVG holding each of `svgs` (str or bytes) side by side, in rows.
+
+    Drawings are placed tallest first on shelves about as wide as the square
+    root of their total area, as nested <svg> elements that keep their own
+    viewBox. Element ids are prefixed per drawing so they stay unique.
+    """
+    boxes = [_split_svg(svg, f'p{k}_') for k, svg in enumerate(svgs)]
+
+    shelf_width = max(max(b[0] for b in boxes), math.sqrt(sum(b[0] * b[1] for b in boxes)))
+    placed = []
+    x = y = row_height = width = 0
+    for w, h, viewbox, body in sorted(boxes, key=lambda b: -b[1]):
+        if x and x + w > shelf_width:
+            x, y, row_height = 0, y + row_height + gap, 0
+        placed.append(f'<svg x="{x:g}" y="{y:g}" width="{w:g}" height="{h:g}" viewBox="{viewbox}">{body}</svg>')
+        width = max(width, x + w)
+        row_height = max(row_height, h)
+        x += w + gap
+    height = y + row_height
+    return "\n".join([
+        f'<svg width="{width:g}pt" height="{height:g}pt" viewBox="0 0 {width:g} {height:g}" '
+        'xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">',
+        *placed,
+        '</svg>',
+    ])
+
+_SVG_NODE_RE = re.compile(r'(<g id="[^"]*" class="node">\s*<title>([^<]*)</title>\s*)<polygon[^>]*?points="([^"]*)"[^>]*/>')
+
+def _render_local_svg(dot):
+    return pipe_graphviz("dot", "svg", lambda stdin: stdin.write(dot.encode('utf-8')))[0].decode('utf-8')
+
+def render_hierarchical(graph, theme_name, layout_engine="dot", splines="ortho", visualization_mode="flow",
+                        collapsed_clusters=None, compact=False, layout_plan=None, render=_render_local_svg,
+                        cache=None, workers=4):
+    """SVG of the graph laid out in two levels: every cluster on its own, then
+    a top-level graph with each cluster as a box the size of its drawing.
+
+    render(DOT text) returns SVG text (default: a local `dot` process).
+    Cluster drawings are kept in `cache` (a DotFragmentCache) under a digest
+    of their DOT that ignores the cluster's id, so after an edit only the
+    changed clusters and the top-level graph are laid out again; missing
+    drawings are rendered by up to `workers` threads. Edges between clusters
+    are routed at the top level to the cluster boxes, merged and counted as
+    for collapsed clusters. Without clusters to draw this is one render of
+    generate_dot_code().
+    """
+    collapsed_clusters = set(collapsed_clusters or ())
+    if layout_plan is None:
+        engine, splines_val, use_clusters = resolve_layout(layout_engine, splines, visualization_mode)
+    else:
+        engine, splines_val, use_clusters = layout_plan.engine, layout_plan.splines, layout_plan.use_clusters
+    options = (theme_name, layout_engine, splines, visualization_mode)
+
+    # Nodes drawn inside each expanded cluster (their first cluster)
+    owned = {}
+    if use_clusters:
+        for i, k in enumerate(graph.node_cluster):
+            if k >= 0 and graph.cluster_ids[k] not in collapsed_clusters:
+                owned.setdefault(k, []).append(i)
+    if not owned:
+        return render(generate_dot_code(graph, *options, collapsed_clusters, compact, layout_plan=layout_plan))
+
+    if cache is None:
+        cache = DotFragmentCache()
+    inner_plan = LayoutPlan(engine, splines_val, True, 0, ())
+    svgs, missing = {}, {}
+    for k, nodes in owned.items():
+        cluster_id = graph.cluster_ids[k]
+        dot = generate_dot_code(graph.subgraph(nodes), *options, None, compact, layout_plan=inner_plan)
+        key = hashlib.md5(dot.replace(f'subgraph {cluster_id} {{', 'subgraph {').encode('utf-8')).digest()
+        svg = cache.get(key)
+        if svg is None:
+            missing[k] = (key, dot)
+        else:
+            svgs[k] = svg.replace('\0', cluster_id)
+    if missing:
+        with ThreadPoolExecutor(min(workers, len(missing))) as pool:
+            rendered = pool.map(lambda item: render(item[1]), missing.values())
+            for (k, (key, _)), svg in zip(missing.items(), rendered):
+                # The id only shows up as the cluster's <title> and comment
+                cluster_id = graph.cluster_ids[k]
+                cache.put(key, svg.replace(f'>{cluster_id}<', '>\0<').replace(f'<!-- {cluster_id} -->', '<!-- \0 -->'))
+                svgs[k] = svg
+
+    drawings = {f'{graph.cluster_ids[k]}_collapsed': _split_svg(svg, f'c{k}_') for k, svg in svgs.items()}
+    top = render(generate_dot_code(
+        graph, *options, collapsed_clusters | {graph.cluster_ids[k] for k in svgs}, compact,
+        layout_plan=LayoutPlan(engine, splines_val, False, 0, ()),
+        proxy_sizes={graph.cluster_ids[k]: drawings[f'{graph.cluster_ids[k]}_collapsed'][:2] for k in svgs},
+    ))
+
+    def place(match):
+        # Swap a placeholder box for the cluster drawing, at the box's position
+        head, title, points = match.groups()
+        drawing = drawings.get(html.unescape(title))
+        if drawing is None:
+            return match.group(0)
+        xs, ys = zip(*(map(float, point.split(',')) for point in points.split()))
+        _, _, viewbox, body = drawing
+        return (f'{head}<svg x="{min(xs):g}" y="{min(ys):g}" width="{max(xs) - min(xs):g}" '
+                f'height="{max(ys) - min(ys):g}" viewBox="{viewbox}">{body}</svg>')
+
+    return _SVG_NODE_RE.sub(place, top)
+
+def generate_drawio_xml(graph, canonical=False):
+    """Generate draw.io XML with proper layout and positioning from a DiagramGraph.
+
+    In canonical mode the output depends only on the graph: the diagram id
+    is a digest of the cells and there is no modified timestamp.
+    """
+    import uuid
+
+    # Create a better layout - arrange nodes in a grid or flow
+    node_width = 180
+    node_height = 80
+    spacing_x = 250
+    spacing_y = 120
+    start_x, start_y = 40, 40
+
+    # Calculate positions for nodes (indexed like graph.node_ids)
+    cols = max(3, int(graph.node_count ** 0.5) + 1)
+    node_x = [start_x + (idx % cols) * spacing_x for idx in range(graph.node_count)]
+    node_y = [start_y + (idx // cols) * spacing_y for idx in range(graph.node_count)]
+
+    # Build XML (the <mxfile>/<diagram> header is added at the end)
+    xml = [
+        '    <mxGraphModel dx="1422" dy="794" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" arrows="1" fold="1" page="1" pageScale="1" pageWidth="1169" pageHeight="827" math="0" shadow="0">',
+        '      <root>',
+        '        <mxCell id="0" />',
+        '        <mxCell id="1" parent="0" />'
+    ]
+
+    # Add clusters as containers (swimlanes)
+    cluster_bounds = {}
+
+    for k, title in enumerate(graph.cluster_titles):
+        cluster_id = f"cluster_{k}"
+
+        # Calculate cluster bounds based on nodes in cluster
+        members = graph.cluster_nodes(k)
+        if members:
+            min_x = min(node_x[i] for i in members) - 20
+            min_y = min(node_y[i] for i in members) - 40
+            max_x = max(node_x[i] for i in members) + node_width + 20
+            max_y = max(node_y[i] for i in members) + node_height + 20
+
+            cluster_bounds[k] = (min_x, min_y, max_x - min_x, max_y - min_y)
+
+            xml.append(f'        <mxCell id="{cluster_id}" value="{html.escape(title)}" style="swimlane;whiteSpace=wrap;html=1;fillColor=#dae8fc;strokeColor=#6c8ebf;startSize=30;fontStyle=1;fontSize=14;" vertex="1" parent="1">')
+            xml.append(f'          <mxGeometry x="{min_x}" y="{min_y}" width="{max_x - min_x}" height="{max_y - min_y}" as="geometry" />')
+            xml.append('        </mxCell>')
+
+    # Add nodes
+    for i, nid in enumerate(graph.node_ids):
+        label = graph.labels[i]
+        style = DRAWIO_STYLES[get_node_type(label)]
+        x, y = node_x[i], node_y[i]
+
+        # Parent is the first cluster containing the node, else the root
+        parent = "1"
+        k = graph.node_cluster[i]
+        if k >= 0:
+            parent = f"cluster_{k}"
+            # Adjust position relative to cluster (account for cluster header)
+            cluster_x, cluster_y, _, _ = cluster_bounds[k]
+            x = x - cluster_x
+            y = y - cluster_y + 30  # Account for cluster header
+
+        xml.append(f'        <mxCell id="{nid}" value="{html.escape(label)}" style="{style}" vertex="1" parent="{parent}">')
+        xml.append(f'          <mxGeometry x="{x}" y="{y}" width="{node_width}" height="{node_height}" as="geometry" />')
+        xml.append('        </mxCell>')
+
+    # Add edges
+    edge_id = 10000
+    for (src, dst, label), n in zip(graph.iter_edges(), graph.edge_weight):
+        stroke = 2
+        if n > 1:  # Merged repeats
+            label = f"{label} ×{n}" if label else f"×{n}"
+            stroke = f"{2 * (1 + math.log2(n)):.2f}"
+        xml.append(f'        <mxCell id="{edge_id}" value="{html.escape(label)}" style="edgeStyle=orthogonalEdgeStyle;rounded=0;orthogonalLoop=1;jettySize=auto;html=1;strokeWidth={stroke};" edge="1" parent="1" source="{src}" target="{dst}">')
+        xml.append('          <mxGeometry relative="1" as="geometry" />')
+        xml.append('        </mxCell>')
+        edge_id += 1
+
+    xml.append('      </root></mxGraphModel></diagram></mxfile>')
+    body = "\n".join(xml)
+
+    if canonical:
+        diagram_id = hashlib.md5(body.encode('utf-8')).hexdigest()
+        modified = ''
+    else:
+        diagram_id = str(uuid.uuid4())
+        modified = ' modified="' + datetime.now().strftime('%Y-%m-%dT%H:%M:%S.000Z') + '"'
+    header = [
+        f'<mxfile host="app.diagrams.net"{modified} agent="CloudDMate" version="21.0.0" type="device">',
+        f'  <diagram id="{diagram_id}" name="Architecture">',
+    ]
+    return "\n".join(header) + "\n" + body
+
+def export_to_json(graph, canonical=False):
+    """Export diagram data to JSON format (without the creation time in canonical mode)."""
+    metadata = {
+        "version": "2.0",
+        "created": datetime.now().isoformat(),
+        "node_count": graph.node_count,
+        "edge_count": graph.edge_count,
+        "cluster_count": graph.cluster_count
+    }
+    if canonical:
+        del metadata["created"]
+    return json.dumps({
+        "metadata": metadata,
+        "nodes": dict(zip(graph.node_ids, graph.labels)),
+        "edges": [dict({"source": src, "target": dst, "label": label}, **({"count": n} if n > 1 else {}))
+                  for (src, dst, label), n in zip(graph.iter_edges(), graph.edge_weight)],
+        "clusters": [{"id": graph.cluster_ids[k], "title": graph.cluster_titles[k], "nodes": graph.cluster_node_ids(k)} for k in range(graph.cluster_count)]
+    }, indent=2)
+
+def load_from_json(json_str):
+    """Load diagram data from JSON format into a DiagramGraph."""
+    try:
+        data = json.loads(json_str)
+        nodes = data.get("nodes", {})
+        edges = [(e["source"], e["target"], e.get("label", ""), e.get("count", 1)) for e in data.get("edges", [])]
+        clusters = []
+        for c in data.get("clusters", []):
+            clusters.append({"id": c["id"], "title": c["title"], "nodes": set(c["nodes"])})
+        return DiagramGraph.from_parts(nodes, edges, clusters)
+    except Exception as e:
+        raise ValueError(f"Invalid JSON format: {e}")
@@ -0,0 +1,453 @@
+import sys
+from array import array
+
+class DiagramGraph:
+    """Compact, array-backed diagram graph.
+
+    Nodes are numbered 0..node_count-1 in order of first appearance;
+    `node_ids` and `labels` are interned strings indexed by that number and
+    `index` maps a node id back to it. Edges keep source order in three
+    parallel arrays; edge labels are indices into the interned `strings`
+    table, where 0 is the empty label. edge_weight[e] is how many edges of
+    the text edge e stands for (1 unless merged by aggregate_edges()).
+
+    Forward and reverse adjacency are CSR arrays: the edge indices leaving
+    node i are out_edges[out_offsets[i]:out_offsets[i + 1]] (in_* likewise
+    for entering edges). Cluster k's members are
+    cluster_members[cluster_offsets[k]:cluster_offsets[k + 1]], ordered by
+    node index; node_cluster[i] is the first cluster containing node i or -1.
+    """
+    __slots__ = (
+        'node_ids', 'labels', 'index',
+        'edge_src', 'edge_dst', 'edge_label', 'edge_weight', 'strings',
+        'cluster_ids', 'cluster_titles', 'cluster_offsets', 'cluster_members',
+        '_out', '_in', '_node_cluster',
+    )
+
+    def __init__(self, node_ids, labels, edge_src, edge_dst, edge_label, strings,
+                 cluster_ids, cluster_titles, cluster_offsets, cluster_members, edge_weight=None):
+        self.node_ids = node_ids
+        self.labels = labels
+        self.index = dict(zip(node_ids, range(len(node_ids))))
+        self.edge_src = edge_src
+        self.edge_dst = edge_dst
+        self.edge_label = edge_label
+        self.edge_weight = edge_weight if edge_weight is not None else array('I', [1]) * len(edge_src)
+        self.strings = strings
+        self.cluster_ids = cluster_ids
+        self.cluster_titles = cluster_titles
+        self.cluster_offsets = cluster_offsets
+        self.cluster_members = cluster_members
+        self._out = None
+        self._in = None
+        self._node_cluster = None
+
+    # --- Construction ---
+    @classmethod
+    def from_parts(cls, nodes, edges, clusters):
+        """Builds the graph from the (nodes, edges, clusters) parser triple.
+
+        Edge endpoints missing from `nodes` become nodes labelled with their
+        id; cluster members missing from `nodes` are dropped. An edge may
+        carry its weight as a fourth item.
+        """
+        builder = _Builder()
+        for nid, label in nodes.items():
+            builder.node(nid, label)
+        for edge in edges:
+            builder.edge(edge[0], edge[1], edge[2] if len(edge) > 2 else "", edge[3] if len(edge) > 3 else 1)
+        for c in clusters:
+            builder.cluster(c['id'], c['title'])
+            for nid in c['nodes']:
+                if nid in nodes:
+                    builder.member(nid)
+        return builder.build()
+
+    @classmethod
+    def from_events(cls, events):
+        """Builds the graph straight from diagram_parser.iter_diagram_events()
+        (or iter_parse()), without the intermediate dicts and tuples."""
+        builder = _Builder()
+        for event in events:
+            kind = event[0]
+            if kind == 'node':
+                builder.node(event[1], event[2])
+                if event[3] is not None:
+                    builder.member(event[1])
+            elif kind == 'edge':
+                builder.edge(event[1], event[2], event[3])
+            else:
+                builder.cluster(event[1], event[2])
+        return builder.build()
+
+    def to_parts(self):
+        """The (nodes, edges, clusters) triple for code that still needs it."""
+        nodes = dict(zip(self.node_ids, self.labels))
+        edges = list(self.iter_edges())
+        clusters = [{'id': self.cluster_ids[k], 'title': self.cluster_titles[k],
+                     'nodes': set(self.cluster_node_ids(k))} for k in range(self.cluster_count)]
+        return nodes, edges, clusters
+
+    # --- Access ---
+    @property
+    def out_offsets(self):
+        return self._out_csr()[0]
+
+    @property
+    def out_edges(self):
+        return self._out_csr()[1]
+
+    @property
+    def in_offsets(self):
+        return self._in_csr()[0]
+
+    @property
+    def in_edges(self):
+        return self._in_csr()[1]
+
+    def _out_csr(self):
+        if self._out is None:
+            self._out = _csr(self.node_count, self.edge_src)
+        return self._out
+
+    def _in_csr(self):
+        if self._in is None:
+            self._in = _csr(self.node_count, self.edge_dst)
+        return self._in
+
+    @property
+    def node_cluster(self):
+        if self._node_cluster is None:
+            node_cluster = array('i', [-1]) * self.node_count
+            for k in range(self.cluster_count - 1, -1, -1):
+                for i in self.cluster_nodes(k):
+                    node_cluster[i] = k
+            self._node_cluster = node_cluster
+        return self._node_cluster
+
+    @property
+    def node_count(self):
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self):
+        return len(self.edge_src)
+
+    @property
+    def cluster_count(self):
+        return len(self.cluster_ids)
+
+    def cluster_nodes(self, k):
+        """Node indices of cluster k."""
+        return self.cluster_members[self.cluster_offsets[k]:self.cluster_offsets[k + 1]]
+
+    def cluster_keys(self):
+        """A key per cluster that does not depend on its position: its title
+        and how many earlier clusters have the same title ("Title#0"), so it
+        survives clusters being added or removed around it."""
+        seen = {}
+        keys = []
+        for title in self.cluster_titles:
+            n = seen.get(title, 0)
+            seen[title] = n + 1
+            keys.append(f"{title}#{n}")
+        return keys
+
+    def cluster_node_ids(self, k):
+        return [self.node_ids[i] for i in self.cluster_nodes(k)]
+
+    def out_neighbors(self, i):
+        return [self.edge_dst[e] for e in self.out_edges[self.out_offsets[i]:self.out_offsets[i + 1]]]
+
+    def in_neighbors(self, i):
+        return [self.edge_src[e] for e in self.in_edges[self.in_offsets[i]:self.in_offsets[i + 1]]]
+
+    def edge(self, e):
+        """(src id, dst id, label) of edge e."""
+        return self.node_ids[self.edge_src[e]], self.node_ids[self.edge_dst[e]], self.strings[self.edge_label[e]]
+
+    def iter_edges(self):
+        node_ids, strings = self.node_ids, self.strings
+        for s, d, l in zip(self.edge_src, self.edge_dst, self.edge_label):
+            yield node_ids[s], node_ids[d], strings[l]
+
+    def components(self):
+        """Node indices of each connected component, ignoring edge direction.
+
+        Members of a cluster always share a component, so a cluster is never
+        split. Components are ordered by their first node, and their nodes
+        by index.
+        """
+        parent = array('I', range(self.node_count))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(i, j):
+            i, j = find(i), find(j)
+            if i != j:
+                parent[max(i, j)] = min(i, j)
+
+        for s, d in zip(self.edge_src, self.edge_dst):
+            union(s, d)
+        for k in range(self.cluster_count):
+            members = self.cluster_nodes(k)
+            for i in members[1:]:
+                union(members[0], i)
+        groups = {}
+        for i in range(self.node_count):
+            groups.setdefault(find(i), []).append(i)
+        return list(groups.values())
+
+    # --- Transformation ---
+    def subgraph(self, nodes):
+        """The graph induced by node indices `nodes`: those nodes in their
+        original order, the edges between them and the clusters they are in."""
+        keep = bytearray(self.node_count)
+        for i in nodes:
+            keep[i] = 1
+        node_ids, labels, strings = self.node_ids, self.labels, self.strings
+        builder = _Builder()
+        for i in range(self.node_count):
+            if keep[i]:
+                builder.node(node_ids[i], labels[i])
+        for s, d, l, w in zip(self.edge_src, self.edge_dst, self.edge_label, self.edge_weight):
+            if keep[s] and keep[d]:
+                builder.edge(node_ids[s], node_ids[d], strings[l], w)
+        for k in range(self.cluster_count):
+            members = [i for i in self.cluster_nodes(k) if keep[i]]
+            if members:
+                builder.cluster(self.cluster_ids[k], self.cluster_titles[k])
+                for i in members:
+                    builder.member(node_ids[i])
+        return builder.build()
+
+    def aggregate_edges(self, merge_parallel=False):
+        """The graph with repeated edges merged into one weighted edge.
+
+        Edges with the same source, target and label become one edge whose
+        weight is the sum of theirs, kept where the first of them was. With
+        merge_parallel=True all edges between the same source and target are
+        merged, and their distinct labels joined with " / ". Nodes and
+        clusters are shared with this graph; returns self if nothing merges.
+        """
+        strings = self.strings
+        merged = {}  # key -> [first edge, weight, label indices]
+        for e, (s, d, l, w) in enumerate(zip(self.edge_src, self.edge_dst, self.edge_label, self.edge_weight)):
+            key = (s, d) if merge_parallel else (s, d, l)
+            entry = merged.get(key)
+            if entry is None:
+                merged[key] = [e, w, [l]]
+            else:
+                entry[1] += w
+                if l not in entry[2]:
+                    entry[2].append(l)
+        if len(merged) == self.edge_count:
+            return self
+
+        strings = list(strings)
+        string_index = {text: l for l, text in enumerate(strings)}
+        edge_src, edge_dst, edge_label, edge_weight = array('I'), array('I'), array('I'), array('I')
+        for e, w, ls in sorted(merged.values()):
+            text = " / ".join(strings[l] for l in ls if l)
+            l = string_index.get(text)
+            if l is None:
+                l = string_index[text] = len(strings)
+                strings.append(sys.intern(text))
+            edge_src.append(self.edge_src[e])
+            edge_dst.append(self.edge_dst[e])
+            edge_label.append(l)
+            edge_weight.append(w)
+        return DiagramGraph(self.node_ids, self.labels, edge_src, edge_dst, edge_label, strings,
+                            self.cluster_ids, self.cluster_titles, self.cluster_offsets, self.cluster_members,
+                            edge_weight)
+
+class IncrementalGraph:
+    """Builds the DiagramGraph of a document parsed block by block (see
+    diagram_parser.parse_diagram_incremental()) by patching the last one.
+
+    build() takes the parser's blocks, where a block that did not change is
+    the same object as on the previous call, along with the combined
+    (nodes, edges, clusters). The edges and cluster members of unchanged
+    blocks are copied from the previous graph as array slices, renumbered
+    with one map() when nodes were inserted or removed before them; only
+    changed blocks are walked edge by edge. The result equals
+    DiagramGraph.from_parts(nodes, edges, clusters). A different number of
+    blocks, or a block gaining or losing its header, rebuilds in full.
+    """
+
+    def __init__(self):
+        self.graph = None
+        self.blocks = []
+        self.edge_starts = []      # per block: index of its first edge, plus the total
+        self.block_clusters = []   # per block: its cluster index, or -1
+
+    def build(self, blocks, nodes, edges, clusters):
+        graph = self.graph
+        if (graph is None or len(blocks) != len(self.blocks)
+                or len(graph.strings) > 2 * graph.edge_count + 64  # drop labels no longer used
+                or any(b is not old and (b['title'] is None) != (old['title'] is None)
+                       for b, old in zip(blocks, self.blocks))):
+            graph = DiagramGraph.from_parts(nodes, edges, clusters)
+        else:
+            graph = self._patch(blocks, nodes)
+        self.graph = graph
+        self.blocks = list(blocks)
+        self.edge_starts = [0]
+        self.block_clusters = []
+        k = 0
+        for block in blocks:
+            self.edge_starts.append(self.edge_starts[-1] + len(block['edges']))
+            self.block_clusters.append(k if block['title'] is not None else -1)
+            k += block['title'] is not None
+        return graph
+
+    def _patch(self, blocks, nodes):
+        old = self.graph
+        node_ids = list(nodes)
+        if node_ids == old.node_ids:
+            remap = None
+            index = old.index
+        elif node_ids[:old.node_count] == old.node_ids:  # new nodes appended
+            remap = None
+            index = dict(zip(node_ids, range(len(node_ids))))
+        else:
+            # Nodes missing from the new table occurred only in changed blocks
+            index = dict(zip(node_ids, range(len(node_ids))))
+            remap = list(map(index.get, old.node_ids))
+        strings = list(old.strings)
+        string_index = dict(zip(strings, range(len(strings))))
+        edge_src, edge_dst, edge_label = array('I'), array('I'), array('I')
+        titles = list(old.cluster_titles)
+        cluster_offsets = array('I', [0])
+        cluster_members = array('I')
+        def copy_edges(start, end):
+            if remap is None:
+                edge_src.extend(old.edge_src[start:end])
+                edge_dst.extend(old.edge_dst[start:end])
+            else:
+                edge_src.extend(map(remap.__getitem__, old.edge_src[start:end]))
+                edge_dst.extend(map(remap.__getitem__, old.edge_dst[start:end]))
+            edge_label.extend(old.edge_label[start:end])
+
+        run = 0  # first edge of the current run of unchanged blocks
+        for b, block in enumerate(blocks):
+            k = self.block_clusters[b]
+            if block is self.blocks[b]:
+                if k >= 0:
+                    members = old.cluster_nodes(k)
+                    cluster_members.extend(members if remap is None else sorted(map(remap.__getitem__, members)))
+                    cluster_offsets.append(len(cluster_members))
+                continue
+            copy_edges(run, self.edge_starts[b])
+            run = self.edge_starts[b + 1]
+            for src, dst, label in block['edges']:
+                l = string_index.get(label)
+                if l is None:
+                    l = string_index[label] = len(strings)
+                    strings.append(sys.intern(label))
+                edge_src.append(index[src])
+                edge_dst.append(index[dst])
+                edge_label.append(l)
+            if k >= 0:
+                titles[k] = block['title']
+                cluster_members.extend(sorted(index[nid] for nid in block['cluster_nodes'] if nid in index))
+                cluster_offsets.append(len(cluster_members))
+        copy_edges(run, self.edge_starts[-1])
+        return DiagramGraph(node_ids, list(nodes.values()), edge_src, edge_dst, edge_label, strings,
+                            old.cluster_ids, titles, cluster_offsets, cluster_members)
+
+EDGE_MERGE_MODES = ("keep", "duplicates", "parallel")
+
+def merge_edges(graph, mode="duplicates"):
+    """graph.aggregate_edges() for one of EDGE_MERGE_MODES: keep every
+    edge, merge identical ones, or merge all edges between two nodes."""
+    if mode not in EDGE_MERGE_MODES:
+        raise ValueError(f"Unknown edge merge mode: {mode}")
+    if mode == "keep":
+        return graph
+    return graph.aggregate_edges(merge_parallel=mode == "parallel")
+
+def _csr(n, keys):
+    """Offsets and edge indices grouped by `keys` (a counting sort, stable)."""
+    offsets = array('I', [0]) * (n + 1)
+    for k in keys:
+        offsets[k + 1] += 1
+    for i in range(n):
+        offsets[i + 1] += offsets[i]
+    fill = array('I', offsets[:-1])
+    order = array('I', [0]) * len(keys)
+    for e, k in enumerate(keys):
+        order[fill[k]] = e
+        fill[k] += 1
+    return offsets, order
+
+class _Builder:
+    """Accumulates nodes, edges and clusters into DiagramGraph arrays."""
+    __slots__ = ('node_ids', 'labels', 'index', 'edge_src', 'edge_dst', 'edge_label', 'edge_weight',
+                 'strings', 'string_index', 'cluster_ids', 'cluster_titles', 'members', 'last_cluster')
+
+    def __init__(self):
+        self.node_ids = []
+        self.labels = []
+        self.index = {}
+        self.edge_src = array('I')
+        self.edge_dst = array('I')
+        self.edge_label = array('I')
+        self.edge_weight = array('I')
+        self.strings = [""]
+        self.string_index = {"": 0}
+        self.cluster_ids = []
+        self.cluster_titles = []
+        self.members = []         # one list of node indices per cluster
+        self.last_cluster = array('i')  # per node: last cluster it was added to
+
+    def _intern_node(self, nid):
+        i = self.index.get(nid)
+        if i is None:
+            i = self.index[nid] = len(self.node_ids)
+            self.node_ids.append(sys.intern(nid))
+            self.labels.append(nid)
+            self.last_cluster.append(-1)
+        return i
+
+    def node(self, nid, label):
+        self.labels[self._intern_node(nid)] = sys.intern(label)
+
+    def edge(self, src, dst, label, weight=1):
+        s = self._intern_node(src)
+        d = self._intern_node(dst)
+        l = self.string_index.get(label)
+        if l is None:
+            l = self.string_index[label] = len(self.strings)
+            self.strings.append(sys.intern(label))
+        self.edge_src.append(s)
+        self.edge_dst.append(d)
+        self.edge_label.append(l)
+        self.edge_weight.append(weight)
+
+    def cluster(self, cid, title):
+        self.cluster_ids.append(cid)
+        self.cluster_titles.append(title)
+        self.members.append([])
+
+    def member(self, nid):
+        """Adds a node to the most recent cluster (once)."""
+        i = self._intern_node(nid)
+        k = len(self.members) - 1
+        if self.last_cluster[i] != k:
+            self.last_cluster[i] = k
+            self.members[k].append(i)
+
+    def build(self):
+        offsets = array('I', [0])
+        flat = array('I')
+        for m in self.members:
+            m.sort()
+            flat.extend(m)
+            offsets.append(len(flat))
+        return DiagramGraph(self.node_ids, self.labels, self.edge_src, self.edge_dst, self.edge_label,
+                            self.strings, self.cluster_ids, self.cluster_titles, offsets, flat, self.edge_weight)
@@ -0,0 +1,115 @@
+"""Keyword classification of node labels: icon prefix and node type.
+
+Both keyword tables are compiled at import into one trie-shaped regular
+expression (an Aho-Corasick style automaton run by the re engine), so a
+label is scanned once for all keywords of both tables. A table's rules
+are tried in order and the first rule with a keyword in the label wins,
+exactly like the original if/elif chains.
+"""
+import re
+from functools import lru_cache
+
+# (icon prefix, keywords); the first matching rule wins
+ICON_RULES = [
+    ("👤 ", ["user", "actor", "client", "customer"]),
+    ("🛢️ ", ["db", "data", "sql", "store", "oracle", "database"]),
+    ("☁️ ", ["cloud", "aws", "azure", "gcp"]),
+    ("🔌 ", ["api", "rest", "json", "endpoint", "service"]),
+    ("🔒 ", ["lock", "auth", "login", "security", "token"]),
+    ("📧 ", ["email", "message", "notification", "alert"]),
+    ("⚠️ ", ["error", "fail", "404", "500", "exception"]),
+    ("⚙️ ", ["settings", "config", "setup", "configuration"]),
+    ("📄 ", ["file", "upload", "excel", "csv", "document"]),
+    ("✅ ", ["check", "validate", "success", "ok", "verified"]),
+    ("🖥️ ", ["web", "site", "dashboard", "ui", "interface"]),
+    ("📱 ", ["mobile", "app", "phone", "ios", "android"]),
+    ("🖥️ ", ["server", "host", "machine", "vm"]),
+    ("🌐 ", ["network", "router", "switch", "gateway"]),
+    ("📬 ", ["queue", "message", "broker", "kafka", "rabbit"]),
+    ("⚡ ", ["cache", "redis", "memcached"]),
+    ("🔍 ", ["search", "elastic", "lucene"]),
+    ("💳 ", ["payment", "transaction", "money", "billing"]),
+    ("📊 ", ["analytics", "report", "metrics", "stats"]),
+    ("📈 ", ["monitor", "log", "trace", "debug"]),
+    ("🚀 ", ["deploy", "ci", "cd", "pipeline", "build"]),
+    ("🧪 ", ["test", "qa", "quality"]),
+    ("▶️ ", ["start", "begin", "init"]),
+    ("🏁 ", ["end", "finish", "complete", "done"]),
+    ("⚖️ ", ["load", "balance", "distribute"]),
+    ("🔄 ", ["sync", "replicate", "copy"]),
+    ("🗑️ ", ["delete", "remove", "drop"]),
+    ("➕ ", ["add", "create", "insert", "new"]),
+    ("✏️ ", ["update", "modify", "edit", "change"]),
+    ("📖 ", ["read", "get", "fetch", "retrieve"]),
+    ("✍️ ", ["write", "post", "put", "save"]),
+]
+
+# (node type, keywords); the first matching rule wins, else "default"
+NODE_TYPE_RULES = [
+    ("database", ["db", "database", "store", "storage", "sql", "oracle"]),
+    ("api", ["api", "post", "get", "endpoint", "request"]),
+    ("error", ["error", "failure", "401", "403", "500"]),
+    ("actor", ["user", "customer", "actor"]),
+    ("ui", ["dashboard", "ui", "screen", "dialog", "wizard", "mode"]),
+]
+
+_NO_RULE = 1 << 30
+
+def _trie_pattern(words):
+    """A regex matching the longest of `words` at a position (trie-shaped,
+    so each position only follows the branch of its next characters)."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = True
+
+    def emit(node):
+        end = node.get('') is True
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if end:
+            # greedy: try the longer keyword first, fall back to this one
+            return '(?:' + body + ')?' if len(branches) > 1 or len(body) > 1 else body + '?'
+        return body
+
+    return emit(trie)
+
+def _build():
+    # Best (lowest) rule index per table for every keyword
+    ranks = {}
+    for table, rules in enumerate((ICON_RULES, NODE_TYPE_RULES)):
+        for index, (_, words) in enumerate(rules):
+            for word in words:
+                best = ranks.setdefault(word, [_NO_RULE, _NO_RULE])
+                best[table] = min(best[table], index)
+    # Matching reports only the longest keyword at a position; every shorter
+    # keyword found there is a prefix of it, so fold prefixes into its ranks.
+    folded = {}
+    for word in ranks:
+        icon, node_type = ranks[word]
+        for other, (other_icon, other_type) in ranks.items():
+            if word.startswith(other):
+                icon = min(icon, other_icon)
+                node_type = min(node_type, other_type)
+        folded[word] = (icon, node_type)
+    return re.compile('(?=(' + _trie_pattern(ranks) + '))'), folded
+
+_KEYWORD_RE, _KEYWORD_RANKS = _build()
+
+@lru_cache(maxsize=65536)
+def classify_label(label):
+    """(icon prefix, node type) of a label, from one scan of its lowercased text."""
+    icon = node_type = _NO_RULE
+    ranks = _KEYWORD_RANKS
+    for word in _KEYWORD_RE.findall(label.lower()):
+        i, t = ranks[word]
+        if i < icon:
+            icon = i
+        if t < node_type:
+            node_type = t
+    return (ICON_RULES[icon][0] if icon != _NO_RULE else "",
+            NODE_TYPE_RULES[node_type][0] if node_type != _NO_RULE else "default")
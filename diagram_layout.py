@@ -0,0 +1,163 @@
+"""Layout configuration and cost model.
+
+resolve_layout() turns the UI choices into the Graphviz engine, splines and
+cluster use that generate_dot_code() emits. estimate_layout_seconds()
+predicts how long that layout takes, and plan_layout() downgrades the
+configuration step by step until the prediction fits a latency budget.
+
+The model is  seconds = BASE_SECONDS + scale * (size / 1000) ** exponent
+                         * SPLINE_FACTOR[splines] * cluster factor
+with size = visible nodes + edges + label characters / 100 and
+(scale, exponent) per engine. The defaults are conservative estimates;
+benchmarks/calibrate_layout.py measures a local Graphviz and prints fitted
+values for these tables.
+
+component_batches() groups a large graph's connected components so that
+they can be laid out in parallel and packed into one drawing.
+"""
+import heapq
+from collections import namedtuple
+
+ENGINE_MAP = {
+    "Hierarchy (Waterfall)": "dot",
+    "Organic (Force)": "neato",
+    "Circular (Ring)": "circo",
+    "Radial (Star)": "twopi",
+    "Freeform": "fdp"
+}
+
+# engine: (scale, exponent)
+ENGINE_COST = {
+    "dot": (1.0, 1.6),
+    "neato": (2.0, 2.0),
+    "fdp": (3.0, 2.0),
+    "sfdp": (0.15, 1.15),
+    "circo": (0.8, 1.8),
+    "twopi": (0.3, 1.3),
+}
+
+SPLINE_FACTOR = {
+    "ortho": 8.0,
+    "curved": 1.6,
+    "spline": 1.5,
+    "polyline": 1.2,
+    "line": 1.0,
+}
+
+CLUSTER_COST = 0.02   # extra cost per cluster (dot and fdp), relative
+BASE_SECONDS = 0.3    # process start-up / request overhead
+
+DEFAULT_BUDGET_SECONDS = 10.0  # the renderer times out at 15 s
+
+PACK_MIN_NODES = 200  # below this, one layout run beats several plus packing
+
+LayoutPlan = namedtuple('LayoutPlan', 'engine splines use_clusters seconds changes')
+
+def resolve_layout(layout_engine="dot", splines="ortho", visualization_mode="flow"):
+    """(engine, splines, use_clusters) for the UI's layout choices."""
+    engine = ENGINE_MAP.get(layout_engine, "dot")
+    if visualization_mode == "sequence":
+        engine = "dot"
+    elif visualization_mode == "mindmap":
+        engine = "twopi"
+    elif visualization_mode == "network":
+        engine = "neato"
+    splines_val = 'curved' if engine in ['neato', 'fdp'] or visualization_mode == "mindmap" else splines
+    use_clusters = engine in ['dot', 'fdp'] and visualization_mode != "sequence"
+    return engine, splines_val, use_clusters
+
+def layout_size(graph, collapsed_clusters=None):
+    """(visible nodes, visible edges, cluster count, label characters) as
+    laid out, with collapsed clusters counted as single proxy nodes."""
+    collapsed = [k for k, cid in enumerate(graph.cluster_ids) if cid in (collapsed_clusters or ())]
+    if not collapsed:
+        return (graph.node_count, graph.edge_count, graph.cluster_count,
+                sum(map(len, graph.labels)))
+    hidden = bytearray(graph.node_count)
+    for k in collapsed:
+        for i in graph.cluster_nodes(k):
+            hidden[i] = 1
+    nodes = graph.node_count - sum(hidden) + len(collapsed)
+    edges = sum(1 for s, d in zip(graph.edge_src, graph.edge_dst) if not hidden[s] and not hidden[d])
+    edges += len({(s if not hidden[s] else -1, d if not hidden[d] else -1)
+                  for s, d in zip(graph.edge_src, graph.edge_dst) if hidden[s] or hidden[d]})
+    chars = sum(len(label) for i, label in enumerate(graph.labels) if not hidden[i])
+    return nodes, edges, graph.cluster_count, chars
+
+def estimate_layout_seconds(size, engine, splines, use_clusters):
+    """Predicted layout time for a layout_size() tuple and configuration."""
+    nodes, edges, clusters, chars = size
+    scale, exponent = ENGINE_COST.get(engine, ENGINE_COST["dot"])
+    work = (nodes + edges + chars / 100) / 1000
+    seconds = scale * work ** exponent * SPLINE_FACTOR.get(splines, SPLINE_FACTOR["spline"])
+    if use_clusters and engine in ("dot", "fdp"):
+        seconds *= 1 + CLUSTER_COST * clusters
+    return BASE_SECONDS + seconds
+
+def _downgrades(engine, splines, use_clusters):
+    """Cheaper configurations to try, in order, with what each one changes."""
+    if splines == "ortho":
+        splines = "polyline"
+        yield engine, splines, use_clusters, "orthogonal lines → polyline"
+    if splines in ("curved", "spline", "polyline"):
+        splines = "line"
+        yield engine, splines, use_clusters, "lines drawn straight"
+    if engine in ("neato", "fdp", "circo"):
+        dropped = " (clusters not drawn)" if use_clusters else ""
+        yield "sfdp", splines, False, f"{engine} layout → sfdp{dropped}"
+        return
+    if use_clusters:
+        use_clusters = False
+        yield engine, splines, use_clusters, "cluster boxes dropped"
+    if engine in ("dot", "twopi"):
+        yield "sfdp", splines, use_clusters, f"{engine} layout → sfdp"
+
+def plan_layout(graph, layout_engine="dot", splines="ortho", visualization_mode="flow",
+                collapsed_clusters=None, budget_seconds=DEFAULT_BUDGET_SECONDS):
+    """The configuration to lay the graph out with.
+
+    Starts from resolve_layout() and applies _downgrades() until the
+    estimate fits `budget_seconds` (None disables downgrading). `changes`
+    lists what was given up, for telling the user; it is empty when the
+    chosen configuration is kept.
+    """
+    engine, splines_val, use_clusters = resolve_layout(layout_engine, splines, visualization_mode)
+    size = layout_size(graph, collapsed_clusters)
+    seconds = estimate_layout_seconds(size, engine, splines_val, use_clusters)
+    changes = []
+    if budget_seconds is not None and seconds > budget_seconds:
+        for engine, splines_val, use_clusters, change in _downgrades(engine, splines_val, use_clusters):
+            changes.append(change)
+            seconds = estimate_layout_seconds(size, engine, splines_val, use_clusters)
+            if seconds <= budget_seconds:
+                break
+    return LayoutPlan(engine, splines_val, use_clusters, round(seconds, 2), tuple(changes))
+
+def component_batches(graph, parts, min_nodes=PACK_MIN_NODES):
+    """The graph's connected components grouped into at most `parts`
+    batches of similar layout work, as sorted node index lists.
+
+    Each batch is laid out on its own (see diagram_export.render_components()),
+    so the slowest batch sets the wall-clock time: components are assigned
+    largest first to the least loaded batch, which keeps that close to the
+    largest component. Graphs under `min_nodes` nodes stay one batch.
+    """
+    if parts <= 1 or graph.node_count < min_nodes:
+        return [list(range(graph.node_count))]
+    out_offsets = graph.out_offsets
+    work = []
+    for nodes in graph.components():
+        edges = sum(out_offsets[i + 1] - out_offsets[i] for i in nodes)
+        work.append((len(nodes) + edges, nodes))
+    if len(work) <= 1:
+        return [nodes for _, nodes in work] or [[]]
+    work.sort(key=lambda w: -w[0])
+    loads = [(0, b) for b in range(min(parts, len(work)))]
+    batches = [[] for _ in loads]
+    for cost, nodes in work:
+        load, b = heapq.heappop(loads)
+        batches[b].extend(nodes)
+        heapq.heappush(loads, (load + cost, b))
+    for nodes in batches:
+        nodes.sort()
+    return batches
@@ -0,0 +1,615 @@
+import codecs
+import hashlib
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from diagram_keywords import classify_label
+
+# --- Enhanced Icon Logic ---
+def add_icons(label):
+    """Injects icons based on keywords to make diagrams more visual and creative."""
+    return f"{classify_label(label)[0]}{label}"
+
+# --- Lexer ---
+# Token kinds emitted by tokenize_diagram(). Every token is a plain
+# (kind, value, line, col) tuple; line and col are 1-based.
+HEADER = "header"   # value: cluster title
+NODE = "node"       # value: node label, box-drawing characters removed
+ARROW = "arrow"     # value: the arrow text (→, -> or =>)
+LABEL = "label"     # value: edge label without the brackets
+VCONN = "vconn"     # value: the connector text (↓, v, |, ||)
+EOL = "eol"         # end of a line that produced nodes, arrows or labels
+
+# One master pattern, tried left to right at every position of the text.
+# Header and connector lines are anchored to the start of a line; inside a
+# flow line the text is cut into labels, arrows and plain text runs.
+_TOKEN_RE = re.compile(r"""
+    (?P<nl>\n)
+  | ^[^\S\n]*\#(?P<header>[^\n]*)
+  | ^[^\S\n]*(?P<vconn>↓|v|\|(?:\ *\|)?)[^\S\n]*$
+  | (?P<label>\[[^\]\n]+\])
+  | (?P<arrow>→|->|=>)
+  | (?P<text>[^\n\[→\-=]+|[\[\-=])
+""", re.MULTILINE | re.VERBOSE)
+
+_BOX_CHARS = str.maketrans("", "", "┌┐└┘│")
+
+def tokenize_diagram(text, first_line=1):
+    """Single-pass tokenizer for the diagram text format.
+
+    Yields (kind, value, line, col) tuples in source order. Node labels are
+    emitted once their segment ends (at an arrow or end of line) but are
+    positioned at their first character, so labels written before a node's
+    text come before its NODE token and labels after it come after.
+    """
+    line = first_line
+    line_start = 0
+    pieces = []      # text runs of the current node segment
+    node_col = 0     # 0 while the segment has no visible text yet
+    held = []        # labels seen after the segment's text started
+    in_row = False
+
+    # The extra newline closes the last line; it adds no token of its own.
+    for m in _TOKEN_RE.finditer(text + "\n"):
+        kind = m.lastgroup
+        if kind == "text":
+            value = m.group()
+            if not node_col and not value.isspace():
+                node_col = m.start() - line_start + len(value) - len(value.lstrip()) + 1
+                in_row = True
+            pieces.append(value)
+            continue
+        if kind == "label":
+            in_row = True
+            token = (LABEL, m.group()[1:-1], line, m.start() - line_start + 1)
+            if node_col:
+                held.append(token)
+            else:
+                yield token
+            continue
+
+        if pieces:
+            # Close the node segment: same clean-up as the old per-part code.
+            label = "".join(pieces).strip()
+            pieces = []
+            if not label.isascii():
+                label = label.translate(_BOX_CHARS)
+            if label.endswith("↓"):
+                label = label[:-1].strip()
+                yield (VCONN, "↓", line, node_col)
+            if label.startswith("↓"):
+                label = label[1:].strip()
+                yield (VCONN, "↓", line, node_col)
+            if label:
+                yield (NODE, label, line, node_col)
+        if held:
+            yield from held
+            held = []
+        node_col = 0
+
+        if kind == "arrow":
+            in_row = True
+            yield (ARROW, m.group(), line, m.start() - line_start + 1)
+        elif kind == "nl":
+            if in_row:
+                yield (EOL, "", line, m.start() - line_start + 1)
+                in_row = False
+            line += 1
+            line_start = m.end()
+        elif kind == "header":
+            yield (HEADER, m.group("header").lstrip("#").strip(), line, m.start("header") - line_start)
+        else:
+            yield (VCONN, m.group("vconn"), line, m.start("vconn") - line_start + 1)
+
+# --- Parser ---
+def _label_digest(label):
+    return hashlib.md5(label.encode('utf-8')).hexdigest()[:10]
+
+def _node_id(label, canonical=False):
+    """Node id for a raw label.
+
+    By default this is the label with non-word runs replaced by '_', so
+    "A-B" and "A B" share the id A_B. In canonical mode a label that is not
+    already a valid id gets a digest of its exact text appended, so distinct
+    labels never share an id and the id does not depend on which label was
+    seen first (blocks can still be parsed independently).
+    """
+    nid = re.sub(r'\W+', '_', label).strip('_')
+    if not nid: return f"node_{_label_digest(label)}"
+    if canonical and nid != label:
+        nid = f"{nid}_{_label_digest(label)}"
+    return nid
+
+@lru_cache(maxsize=65536)
+def _node_entry(label, canonical=False):
+    """(node id, label with icon) for a raw node label, shared across parses."""
+    return _node_id(label, canonical), add_icons(label)
+
+def iter_diagram_events(tokens, canonical=False):
+    """Turns a token stream into graph events, as soon as they are known.
+
+    Yields ('cluster', cluster_id, title), ('node', node_id, label, cluster_id)
+    and ('edge', src, dst, label) tuples; cluster_id is None for nodes that
+    appear before the first header. A node id is reported every time the
+    node appears, so the last label wins when events are collected.
+
+    Edge labels belong to the arrow before them; a label written before the
+    first arrow of a line belongs to that line's first arrow, and a label
+    that opens a line belongs to the incoming vertical (↓) connection.
+
+    With `canonical`, node ids are collision-free (see _node_id()).
+    """
+    cluster_id = None
+    cluster_counter = 0
+    last_node_id_of_prev_line = None
+    connect_next_line = False
+
+    row = []             # node ids of the current line
+    row_labels = {}      # edge index within the row -> label
+    lead_label = None    # label written before any node of the line
+    nodes_at_arrow = 0   # len(row) when the last arrow was read
+
+    for kind, value, _line, _col in tokens:
+        if kind == NODE:
+            nid, label = _node_entry(value, canonical)
+            row.append(nid)
+            yield ('node', nid, label, cluster_id)
+        elif kind == ARROW:
+            nodes_at_arrow = len(row)
+        elif kind == LABEL:
+            if row:
+                row_labels[max(nodes_at_arrow - 1, 0)] = value
+            else:
+                lead_label = value
+        elif kind == VCONN:
+            connect_next_line = True
+        elif kind == EOL:
+            if row:
+                if connect_next_line and last_node_id_of_prev_line:
+                    yield ('edge', last_node_id_of_prev_line, row[0], lead_label or "")
+                    connect_next_line = False
+                elif lead_label is not None and 0 not in row_labels:
+                    row_labels[0] = lead_label
+                for i in range(len(row) - 1):
+                    yield ('edge', row[i], row[i + 1], row_labels.get(i, ""))
+                last_node_id_of_prev_line = row[-1]
+                row = []
+            row_labels = {}
+            lead_label = None
+            nodes_at_arrow = 0
+        else:  # HEADER
+            cluster_id = f'cluster_{cluster_counter}'
+            cluster_counter += 1
+            yield ('cluster', cluster_id, value)
+            last_node_id_of_prev_line = None
+            connect_next_line = False
+
+def collect_diagram(events):
+    """Builds the (nodes, edges, clusters) triple from iter_diagram_events()."""
+    clusters = []
+    nodes = {}
+    edges = []  # (src, dst, label) tuples
+    current_cluster = None
+
+    for event in events:
+        kind = event[0]
+        if kind == 'node':
+            nodes[event[1]] = event[2]
+            if current_cluster:
+                current_cluster['nodes'].add(event[1])
+        elif kind == 'edge':
+            edges.append(event[1:])
+        else:
+            current_cluster = {'id': event[1], 'title': event[2], 'nodes': set()}
+            clusters.append(current_cluster)
+
+    return nodes, edges, clusters
+
+def parse_diagram_data(text, canonical=False, workers=1):
+    """Enhanced parser with edge label support, built on tokenize_diagram().
+
+    With workers > 1 (None = one per CPU) a large text is parsed in chunks
+    by a process pool; see parse_diagram_parallel().
+    """
+    if workers != 1 and len(text) >= PARALLEL_MIN_CHARS:
+        return parse_diagram_parallel(text, canonical, workers)
+    return collect_diagram(iter_diagram_events(tokenize_diagram(text), canonical))
+
+# --- Streaming parsing ---
+def tokenize_stream(source, chunk_size=1 << 16):
+    """tokenize_diagram() over a file-like or mmap source, chunk by chunk.
+
+    `source` only needs a read(size) method returning str or bytes (bytes are
+    decoded as UTF-8). Chunks are cut after their last newline, so memory
+    stays bounded by the chunk size plus the longest line.
+    """
+    decoder = None
+    carry = ""
+    line = 1
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        if not isinstance(chunk, str):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder('utf-8')()
+            chunk = decoder.decode(chunk)
+        chunk = carry + chunk
+        cut = chunk.rfind('\n') + 1
+        if not cut:
+            carry = chunk
+            continue
+        carry = chunk[cut:]
+        yield from tokenize_diagram(chunk[:cut], line)
+        line += chunk.count('\n', 0, cut)
+    if decoder is not None:
+        carry += decoder.decode(b'', final=True)
+    if carry:
+        yield from tokenize_diagram(carry, line)
+
+def iter_parse(source, chunk_size=1 << 16, canonical=False):
+    """Streams graph events (see iter_diagram_events) from a file-like or mmap source."""
+    return iter_diagram_events(tokenize_stream(source, chunk_size), canonical)
+
+# --- Parallel parsing ---
+PARALLEL_MIN_CHARS = 1 << 20  # below this, starting workers costs more than it saves
+
+def split_chunks(text, parts):
+    """Splits the text at '#' header lines into at most `parts` chunks of
+    similar size. Chunks join back into `text`."""
+    blocks = split_blocks(text)
+    target = len(text) / max(parts, 1)
+    chunks = []
+    current = []
+    size = 0
+    for block in blocks:
+        current.append(block)
+        size += len(block)
+        if size >= target:
+            chunks.append(''.join(current))
+            current = []
+            size = 0
+    if current:
+        chunks.append(''.join(current))
+    return chunks
+
+def _parse_chunk(args):
+    text, canonical = args
+    nodes, edges, clusters = parse_diagram_data(text, canonical)
+    return nodes, edges, [(c['title'], c['nodes']) for c in clusters]
+
+def parse_diagram_parallel(text, canonical=False, workers=None):
+    """parse_diagram_data() with the chunks of split_chunks() parsed in
+    worker processes and stitched back together.
+
+    A header resets the vertical (↓) chain, so no edge crosses a chunk
+    boundary. Stitching merges the node tables in chunk order (a node keeps
+    its first position and its last label), concatenates the edges and
+    renumbers the clusters, so the result equals the serial parse.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = split_chunks(text, workers * 2)
+    if len(chunks) < 2:
+        return parse_diagram_data(text, canonical)
+
+    nodes, edges, clusters = {}, [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_nodes, chunk_edges, chunk_clusters in pool.map(_parse_chunk, [(c, canonical) for c in chunks]):
+            nodes.update(chunk_nodes)
+            edges.extend(chunk_edges)
+            for title, members in chunk_clusters:
+                clusters.append({'id': f'cluster_{len(clusters)}', 'title': title, 'nodes': members})
+    return nodes, edges, clusters
+
+# --- Validation ---
+EMPTY_TEXT_ERROR = "Diagram text is empty. Please enter some content."
+NO_CONTENT_WARNING = "No nodes or clusters detected. Make sure to use arrows (→, ->, =>) or cluster markers (#)"
+
+def _diagnostic(message, line=None, col=None, end_col=None):
+    return {'line': line, 'col': col, 'end_col': end_col, 'message': message}
+
+def format_diagnostic(diagnostic):
+    """'Line 3, col 12: message' (or just the message for document-wide findings).
+
+    Diagnostics from an included module are prefixed with its name.
+    """
+    if diagnostic['line'] is None:
+        text = diagnostic['message']
+    else:
+        text = f"Line {diagnostic['line']}, col {diagnostic['col']}: {diagnostic['message']}"
+    if diagnostic.get('source'):
+        text = f"{diagnostic['source']}: {text}"
+    return text
+
+def _validate_tokens(tokens, errors, warnings, seen):
+    """Passes tokens through unchanged while collecting diagnostics.
+
+    Brackets left over in node text (or inside a label) on a line with
+    arrows are unbalanced; '<' and '>' are reported outside of arrows.
+    `seen` records whether any arrow or header was read.
+    """
+    line = None
+    has_arrow = False
+    balance = 0
+    bracket_at = None    # (col, end_col) of the first stray bracket on the line
+    angle_warned = False
+
+    for token in tokens:
+        kind, value, tok_line, col = token
+        if tok_line != line:
+            if has_arrow and balance:
+                errors.append(_diagnostic("Unbalanced brackets in edge labels", line, *bracket_at))
+            line = tok_line
+            has_arrow = False
+            balance = 0
+            bracket_at = None
+            angle_warned = False
+
+        if kind == ARROW:
+            has_arrow = True
+            seen['arrow'] = True
+        elif kind == NODE or kind == LABEL or kind == HEADER:
+            if kind == HEADER:
+                seen['header'] = True
+                if len(value) > 100:
+                    warnings.append(_diagnostic(f"Cluster title is very long ({len(value)} chars)", line, col, col + len(value)))
+                if '→' in value or '->' in value or '=>' in value:
+                    has_arrow = True
+                    seen['arrow'] = True
+            start = col + 1 if kind == LABEL else col
+            if '[' in value or ']' in value:
+                delta = value.count('[') - value.count(']')
+                if delta and bracket_at is None:
+                    offset = min(i for i in (value.find('['), value.find(']')) if i >= 0)
+                    bracket_at = (start + offset, start + len(value))
+                balance += delta
+            if not angle_warned and ('<' in value or '>' in value):
+                offset = min(i for i in (value.find('<'), value.find('>')) if i >= 0)
+                warnings.append(_diagnostic("Contains potentially problematic characters (< or >)", line, start + offset, start + offset + 1))
+                angle_warned = True
+        yield token
+
+    if has_arrow and balance:
+        errors.append(_diagnostic("Unbalanced brackets in edge labels", line, *bracket_at))
+
+def parse_and_validate(text, first_line=1, canonical=False):
+    """Parses and validates in one pass over the text.
+
+    Returns (nodes, edges, clusters, errors, warnings). Errors and warnings
+    are diagnostic dicts with 'line', 'col', 'end_col' (1-based, end
+    exclusive) and 'message'; see format_diagnostic().
+    """
+    if not text or not text.strip():
+        return {}, [], [], [_diagnostic(EMPTY_TEXT_ERROR)], []
+    errors, warnings, seen = [], [], {}
+    tokens = _validate_tokens(tokenize_diagram(text, first_line), errors, warnings, seen)
+    nodes, edges, clusters = collect_diagram(iter_diagram_events(tokens, canonical))
+    if not seen:
+        warnings.append(_diagnostic(NO_CONTENT_WARNING))
+    return nodes, edges, clusters, errors, warnings
+
+# --- Incremental parsing ---
+_BLOCK_START_RE = re.compile(r'^[^\S\n]*#', re.MULTILINE)
+
+def split_blocks(text):
+    """Splits the text at '#' header lines.
+
+    The first block is the (possibly empty) text before the first header;
+    every other block starts with its header line. A header resets the
+    vertical (↓) chain, so blocks parse independently of each other.
+    """
+    blocks = []
+    start = 0
+    for m in _BLOCK_START_RE.finditer(text):
+        blocks.append(text[start:m.start()])
+        start = m.start()
+    blocks.append(text[start:])
+    return blocks
+
+def _parse_block(block_text, canonical):
+    errors, warnings, seen = [], [], {}
+    tokens = _validate_tokens(tokenize_diagram(block_text), errors, warnings, seen)
+    nodes, edges, clusters = collect_diagram(iter_diagram_events(tokens, canonical))
+    cluster = clusters[0] if clusters else None
+    return {
+        'nodes': nodes,
+        'edges': edges,
+        'title': cluster['title'] if cluster else None,
+        'cluster_nodes': cluster['nodes'] if cluster else None,
+        'line_count': block_text.count('\n'),
+        'errors': errors,      # lines relative to the block
+        'warnings': warnings,
+        'has_content': bool(seen),
+    }
+
+def _block_diagnostics(blocks, key):
+    found = []
+    offset = 0
+    for block in blocks:
+        for d in block[key]:
+            found.append(dict(d, line=d['line'] + offset))
+        offset += block['line_count']
+    return found
+
+def _relink_blocks(blocks, nodes, edges, clusters):
+    """Rebuilds the combined (nodes, edges, clusters) in place from parsed blocks."""
+    nodes.clear()
+    edges.clear()
+    clusters.clear()
+    for block in blocks:
+        nodes.update(block['nodes'])
+        edges.extend(block['edges'])
+        if block['title'] is not None:
+            clusters.append({'id': f'cluster_{len(clusters)}', 'title': block['title'], 'nodes': block['cluster_nodes']})
+
+def parse_diagram_incremental(text, state, canonical=False):
+    """parse_and_validate() that only re-parses the blocks that changed.
+
+    `state` is a dict kept between calls (e.g. in st.session_state). It holds
+    the content hash, parse result and diagnostics of every block plus the
+    combined (nodes, edges, clusters), which are patched in place. Returns
+    the same (nodes, edges, clusters, errors, warnings) as
+    parse_and_validate(text).
+    """
+    if not text or not text.strip():
+        return {}, [], [], [_diagnostic(EMPTY_TEXT_ERROR)], []
+    texts = split_blocks(text)
+    digests = [hashlib.md5(t.encode('utf-8')).digest() for t in texts]
+    if state.get('canonical', canonical) != canonical:
+        state.clear()  # cached blocks were parsed with the other id scheme
+    state['canonical'] = canonical
+    old_digests = state.get('digests')
+    blocks = state.get('blocks')
+    result = state.get('result')
+
+    if result is None or len(digests) != len(old_digests):
+        # Blocks were added or removed: reuse what we can by content hash.
+        by_digest = dict(zip(old_digests or (), blocks or ()))
+        blocks = [by_digest.get(d) or _parse_block(t, canonical) for d, t in zip(digests, texts)]
+        result = state.get('result') or ({}, [], [])
+        _relink_blocks(blocks, *result)
+    else:
+        nodes, edges, clusters = result
+        relink_nodes = False
+        edge_start = 0
+        for i, (digest, block_text) in enumerate(zip(digests, texts)):
+            old = blocks[i]
+            if digest != old_digests[i]:
+                new = blocks[i] = _parse_block(block_text, canonical)
+                edges[edge_start:edge_start + len(old['edges'])] = new['edges']
+                if i:  # every block after the first starts with a header
+                    clusters[i - 1]['title'] = new['title']
+                    clusters[i - 1]['nodes'] = new['cluster_nodes']
+                if list(new['nodes'].items()) != list(old['nodes'].items()):
+                    relink_nodes = True
+            edge_start += len(blocks[i]['edges'])
+        if relink_nodes:
+            # First occurrence fixes a node's position and the last label
+            # wins, so the node table is re-linked across all blocks.
+            nodes.clear()
+            for block in blocks:
+                nodes.update(block['nodes'])
+
+    state['digests'] = digests
+    state['blocks'] = blocks
+    state['result'] = result
+    errors = _block_diagnostics(blocks, 'errors')
+    warnings = _block_diagnostics(blocks, 'warnings')
+    if not any(block['has_content'] for block in blocks):
+        warnings.append(_diagnostic(NO_CONTENT_WARNING))
+    return (*result, errors, warnings)
+
+def parsed_blocks(state, nodes):
+    """The blocks behind the last parse_diagram_incremental() or
+    parse_diagram_modules() call with `state`, if that call returned the
+    node table `nodes`; None otherwise (e.g. for text with includes)."""
+    state = state.get('root', state)
+    result = state.get('result')
+    if result is None or result[0] is not nodes:
+        return None
+    return state['blocks']
+
+# --- Modules (!include) ---
+_INCLUDE_RE = re.compile(r'^([^\S\n]*)!include[^\S\n]+(\S.*?)[^\S\n]*$', re.MULTILINE)
+
+def split_includes(text):
+    """Splits the text at '!include <module>' lines.
+
+    Yields ('text', segment, first_line) and ('include', name, line, col)
+    items in order; the include lines themselves are not part of any segment.
+    """
+    start = 0
+    line = 1
+    for m in _INCLUDE_RE.finditer(text):
+        yield ('text', text[start:m.start()], line)
+        line += text.count('\n', start, m.start())
+        yield ('include', m.group(2), line, len(m.group(1)) + 1)
+        start = m.end() + 1  # skip the newline ending the include line
+        line += 1
+    yield ('text', text[start:], line)
+
+def _expand_includes(text, source, load_module, stack, units, errors):
+    """Appends (segment, source, first_line) units for `text` with its
+    includes resolved recursively, and reports bad includes in `errors`."""
+    for item in split_includes(text):
+        if item[0] == 'text':
+            if item[1]:
+                units.append((item[1], source, item[2]))
+            continue
+        _, name, line, col = item
+        where = (line, col, col + len('!include ') + len(name))
+        if name in stack:
+            cycle = ' → '.join(stack[stack.index(name):] + [name])
+            errors.append(dict(_diagnostic(f"Include cycle: {cycle}", *where), source=source))
+            continue
+        try:
+            module_text = load_module(name)
+        except Exception as e:
+            errors.append(dict(_diagnostic(f"Cannot load module '{name}': {e}", *where), source=source))
+            continue
+        if module_text is None:
+            errors.append(dict(_diagnostic(f"Module '{name}' not found", *where), source=source))
+            continue
+        _expand_includes(module_text, name, load_module, stack + [name], units, errors)
+
+def parse_diagram_modules(text, load_module, state, canonical=False):
+    """parse_diagram_incremental() for text that may '!include' modules.
+
+    `load_module(name)` returns a module's text (None if there is none).
+    The include line is replaced by the module's content: a module's nodes
+    before its first header join the enclosing cluster, and its headers
+    add clusters. The vertical (↓) chain does not run across an include
+    line. Modules may include other modules; cycles are reported as errors.
+
+    The parse of every text segment and module is cached in `state` by
+    content hash, so editing one module re-parses only that module before
+    the combined graph is re-linked. Diagnostics from modules carry the
+    module name in 'source'. Text without includes goes straight to
+    parse_diagram_incremental().
+    """
+    if not text or not text.strip():
+        return {}, [], [], [_diagnostic(EMPTY_TEXT_ERROR)], []
+    if state.get('canonical', canonical) != canonical:
+        state.clear()
+    state['canonical'] = canonical
+    if '!include' not in text:
+        state.pop('units', None)
+        return parse_diagram_incremental(text, state.setdefault('root', {}), canonical)
+    state.pop('root', None)
+
+    units = []
+    errors, warnings = [], []
+    _expand_includes(text, None, load_module, [], units, errors)
+
+    cache = state.get('units', {})
+    used = {}
+    nodes, edges, clusters = {}, [], []
+    current = None
+    has_content = False
+    for unit_text, source, first_line in units:
+        digest = hashlib.md5(unit_text.encode('utf-8')).digest()
+        blocks = used.get(digest) or cache.get(digest)
+        if blocks is None:
+            blocks = [_parse_block(t, canonical) for t in split_blocks(unit_text)]
+        used[digest] = blocks
+
+        for key, found in (('errors', errors), ('warnings', warnings)):
+            for d in _block_diagnostics(blocks, key):
+                d['line'] += first_line - 1
+                found.append(dict(d, source=source) if source else d)
+        for block in blocks:
+            nodes.update(block['nodes'])
+            edges.extend(block['edges'])
+            if block['title'] is not None:
+                current = {'id': f'cluster_{len(clusters)}', 'title': block['title'], 'nodes': set(block['cluster_nodes'])}
+                clusters.append(current)
+            elif current is not None:
+                current['nodes'].update(block['nodes'])
+            has_content = has_content or block['has_content']
+
+    state['units'] = used  # drop modules that are no longer included
+    if not has_content:
+        warnings.append(_diagnostic(NO_CONTENT_WARNING))
+    return nodes, edges, clusters, errors, warnings
@@ -0,0 +1,141 @@
+"""Memoized text → diagram pipeline.
+
+Every step (parse, DOT, draw.io, JSON, render, ...) is a Stage: a function
+memoized on a fingerprint of its exact inputs, with a small LRU of its own.
+A stage's result carries that fingerprint as its key, and a stage fed with
+upstream results is keyed on their keys, so a rerun only recomputes the
+stages downstream of whatever input changed:
+
+    pipeline = DiagramPipeline()
+    parsed = pipeline.parse(text, modules)     # Output(key, (graph, errors, warnings))
+    graph = pipeline.edges(pipeline.graph_of(parsed), "duplicates")
+    plan = pipeline.layout(graph, engine, splines, mode, collapsed, budget)
+    dot = pipeline.dot(graph, theme, engine, splines, mode, collapsed, compact, plan)  # (DOT, md5)
+    html = pipeline.stage('html', to_html)(dot)  # app-specific stages
+"""
+import hashlib
+import io
+from collections import OrderedDict, namedtuple
+
+from diagram_export import DotFragmentCache, export_to_json, generate_drawio_xml, write_dot
+from diagram_graph import DiagramGraph, IncrementalGraph, merge_edges
+from diagram_layout import component_batches, plan_layout
+from diagram_parser import parse_diagram_modules, parsed_blocks
+
+Output = namedtuple('Output', 'key value')
+
+def _key_part(value):
+    """A stable, hashable stand-in for one stage input."""
+    if isinstance(value, Output):
+        return value.key
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(map(repr, value)))
+    if isinstance(value, dict):
+        return tuple(sorted((repr(k), _key_part(v)) for k, v in value.items()))
+    if isinstance(value, str) and len(value) > 256:
+        return hashlib.md5(value.encode('utf-8')).hexdigest()
+    return repr(value)
+
+def fingerprint(name, inputs):
+    parts = repr((name, tuple(map(_key_part, inputs))))
+    return hashlib.md5(parts.encode('utf-8')).hexdigest()
+
+class Stage:
+    """One pipeline step, memoized on a fingerprint of its inputs.
+
+    Inputs are upstream Outputs (keyed by their key, passed on as their value)
+    or plain values (keyed by their repr; sets and dicts are sorted first). At most
+    `maxsize` results are kept, least recently used first out.
+    """
+    __slots__ = ('name', 'fn', 'maxsize', 'cache', 'hits', 'misses')
+
+    def __init__(self, name, fn, maxsize=8):
+        self.name = name
+        self.fn = fn
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, *inputs):
+        key = fingerprint(self.name, inputs)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return Output(key, self.cache[key])
+        self.misses += 1
+        value = self.fn(*[i.value if isinstance(i, Output) else i for i in inputs])
+        self.cache[key] = value
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return Output(key, value)
+
+    def clear(self):
+        self.cache.clear()
+
+class DiagramPipeline:
+    """The stages of the diagram app; keep one instance per session.
+
+    The built-in stages cover parsing (with validation), edge merging,
+    layout planning and the text outputs; stage() registers app-specific ones such as rendering.
+    """
+
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self.parse_state = {}
+        self.graphs = IncrementalGraph()
+        self.dot_fragments = DotFragmentCache()
+        self.cluster_svgs = DotFragmentCache(maxsize=1024)  # for render_hierarchical()
+        self.stages = {}
+        self.parse = self.stage('parse', self._parse)
+        self.edges = self.stage('edges', merge_edges)
+        self.layout = self.stage('layout', plan_layout)
+        self.dot = self.stage('dot', self._dot)
+        self.drawio = self.stage('drawio', generate_drawio_xml)
+        self.json = self.stage('json', export_to_json)
+
+    def stage(self, name, fn, maxsize=None):
+        """The Stage called `name`, created with `fn` on first use."""
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = Stage(name, fn, maxsize or self.maxsize)
+        return stage
+
+    def _parse(self, text, modules=None):
+        # `modules` maps '!include' names to their text. The incremental
+        # parser patches its result in place on the next call, so the cached
+        # value is a DiagramGraph snapshot of it, patched from the previous
+        # snapshot block by block where the parser reports its blocks.
+        modules = modules or {}
+        nodes, edges, clusters, errors, warnings = parse_diagram_modules(text, modules.get, self.parse_state)
+        blocks = parsed_blocks(self.parse_state, nodes)
+        if blocks is None:
+            return DiagramGraph.from_parts(nodes, edges, clusters), errors, warnings
+        return self.graphs.build(blocks, nodes, edges, clusters), errors, warnings
+
+    def _dot(self, graph, theme_name, layout_engine="dot", splines="ortho", visualization_mode="flow",
+             collapsed_clusters=None, compact=False, layout_plan=None):
+        # A new text usually changes only a few clusters; the others are
+        # reassembled from their cached DOT fragments. The DOT is hashed as
+        # write_dot() streams it out, so the value is (DOT, md5 hexdigest) and
+        # the render caches need no second pass over the text.
+        out = io.BytesIO()
+        digest, _ = write_dot(out, graph, theme_name, layout_engine, splines, visualization_mode,
+                              collapsed_clusters, compact, fragment_cache=self.dot_fragments,
+                              layout_plan=layout_plan)
+        return out.getvalue().decode('utf-8'), digest
+
+    def components(self, graph, parts):
+        """`graph` split into at most `parts` batches of connected components
+        (see component_batches()), as graph Outputs for the other stages."""
+        split = self.stage('components', lambda g, n: [g.subgraph(b) for b in component_batches(g, n)])(graph, parts)
+        return [Output(f'{split.key}/{k}', part) for k, part in enumerate(split.value)]
+
+    @staticmethod
+    def graph_of(parsed):
+        """The DiagramGraph of a parse Output, as an Output with the same key."""
+        return Output(parsed.key, parsed.value[0])
+
+    def stats(self):
+        """{stage name: (hits, misses, cached entries)}."""
+        return {name: (s.hits, s.misses, len(s.cache)) for name, s in self.stages.items()}
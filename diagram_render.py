@@ -0,0 +1,568 @@
+"""Rendering DOT text to SVG, PNG or PDF through interchangeable backends.
+
+    renderer = make_renderer("auto")           # local Graphviz, else quickchart.io
+    svg = renderer.render(dot_code, "svg")     # Rendered(data, backend, seconds)
+
+LocalRenderer runs the Graphviz binaries on this host; QuickChartRenderer
+posts to the quickchart.io service through a RemoteClient, which keeps
+connections alive, caps concurrent requests, retries server errors and
+timeouts with backoff, and stops calling a failing service for a while
+(CircuitBreaker) so renders fall through fast. FallbackRenderer tries several in
+order and uses the first that succeeds. Every renderer keeps a short
+history of its renders (backend, format, seconds, error) for display.
+
+LayoutPool runs a renderer's jobs on long-lived worker threads with a
+bounded queue. With a warm LocalRenderer, each worker keeps its Graphviz
+processes (GraphvizSession) running between jobs instead of starting one
+per render:
+
+    renderer = LayoutPool(make_renderer("auto", warm=True), workers=4)
+
+LayoutResult lays a graph out once and draws SVG, PNG or PDF from that
+layout when each is first asked for, optionally through a DiskCache
+(diagram_cache) shared with other processes.
+"""
+import hashlib
+import os
+import queue
+import random
+import re
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque, namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from diagram_cache import cache_key
+from diagram_export import pipe_graphviz
+
+QUICKCHART_URL = "https://quickchart.io/graphviz"
+RENDER_TIMEOUT = 15  # seconds
+
+BACKENDS = ("auto", "local", "quickchart")
+
+Rendered = namedtuple('Rendered', 'data backend seconds')
+RenderRecord = namedtuple('RenderRecord', 'backend output_format seconds error')
+
+class Renderer:
+    """Turns DOT text into image bytes; subclasses implement _render()."""
+    name = "renderer"
+
+    def __init__(self, timeout=RENDER_TIMEOUT, history=20):
+        self.timeout = timeout
+        self.history = deque(maxlen=history)
+        self.renders = 0  # records ever added to history
+
+    def available(self):
+        return True
+
+    def supports(self, output_format):
+        return True
+
+    def render(self, dot_code, output_format="svg", timeout=None):
+        """Rendered(data bytes, backend name, seconds). Raises RuntimeError
+        if the backend fails or takes longer than `timeout` seconds (default:
+        the renderer's)."""
+        start = time.perf_counter()
+        try:
+            data = self._render(dot_code, output_format, timeout or self.timeout)
+        except Exception as e:
+            self.record(RenderRecord(self.name, output_format, time.perf_counter() - start, str(e)))
+            raise RuntimeError(f"{self.name}: {e}") from e
+        seconds = time.perf_counter() - start
+        self.record(RenderRecord(self.name, output_format, seconds, None))
+        return Rendered(data, self.name, seconds)
+
+    def record(self, entry):
+        self.history.append(entry)
+        self.renders += 1
+
+    def _render(self, dot_code, output_format, timeout):
+        raise NotImplementedError
+
+class GraphvizSession:
+    """A long-lived Graphviz process that lays out one graph after another.
+
+    `dot` reads any number of graphs from stdin and writes one output per
+    graph, so a job is the DOT text in and the output read up to the end
+    marker of its format. A session that fails or misses a deadline is
+    killed; its owner starts a new one.
+    """
+    # Laid-out DOT ends with the graph's "}" on a line of its own; subgraphs
+    # close indented, and a "}" after a line continuation is inside a string
+    END_MARKERS = {"svg": b"</svg>", "png": b"IEND\xaeB`\x82", "pdf": b"%%EOF", "dot": b"\n}"}
+
+    def __init__(self, command, output_format):
+        self.output_format = output_format
+        self.end_marker = self.END_MARKERS[output_format]
+        self.proc = subprocess.Popen([command, f"-T{output_format}"], stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.jobs = 0
+        self.chunks = queue.Queue()
+        self.errors = deque(maxlen=20)
+        threading.Thread(target=self._read, args=(self.proc.stdout, self.chunks.put), daemon=True).start()
+        threading.Thread(target=self._read, args=(self.proc.stderr, self.errors.append), daemon=True).start()
+
+    @staticmethod
+    def _read(stream, sink):
+        # Chunks as they arrive, then None at end of stream
+        for chunk in iter(lambda: os.read(stream.fileno(), 1 << 16), b''):
+            sink(chunk)
+        sink(None)
+
+    @property
+    def alive(self):
+        return self.proc.poll() is None
+
+    def rss(self):
+        """Resident memory of the process in bytes (0 where unknown)."""
+        try:
+            with open(f"/proc/{self.proc.pid}/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError, AttributeError):
+            return 0
+
+    def render(self, dot_code, timeout):
+        deadline = time.monotonic() + timeout
+        try:
+            self.proc.stdin.write(dot_code.encode('utf-8') + b"\n")
+            self.proc.stdin.flush()
+        except OSError:
+            self.close()
+            raise RuntimeError(self._exit_message())
+        out = bytearray()
+        while not self._complete(out):
+            try:
+                chunk = self.chunks.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                self.close()
+                raise RuntimeError(f"timed out after {timeout} s")
+            if chunk is None:
+                self.close()
+                raise RuntimeError(self._exit_message())
+            out += chunk
+        self.jobs += 1
+        return bytes(out)
+
+    def _complete(self, out):
+        out = out.rstrip()
+        return out.endswith(self.end_marker) and not (self.output_format == "dot" and out.endswith(b"\\\n}"))
+
+    def _exit_message(self):
+        self.proc.wait()
+        message = b"".join(e for e in self.errors if e).decode('utf-8', 'replace').strip()
+        return f"Graphviz exited with status {self.proc.returncode}: {message}"
+
+    def close(self):
+        if self.alive:
+            self.proc.kill()
+        self.proc.wait()
+
+class LocalRenderer(Renderer):
+    """Graphviz binaries on this host; the DOT's layout= picks the engine.
+
+    By default every render starts a Graphviz process. With warm=True each
+    calling thread keeps a GraphvizSession per output format and reuses it,
+    recycling it after `max_jobs` jobs or once it uses more than `max_rss`
+    bytes; meant for the long-lived workers of a LayoutPool.
+    """
+    name = "local Graphviz"
+
+    def __init__(self, command="dot", warm=False, max_jobs=200, max_rss=512 << 20, **kwargs):
+        super().__init__(**kwargs)
+        self.command = command
+        self.warm = warm
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.sessions = threading.local()
+
+    def available(self):
+        return shutil.which(self.command) is not None
+
+    def _render(self, dot_code, output_format, timeout):
+        if not self.warm or output_format not in GraphvizSession.END_MARKERS:
+            data = dot_code.encode('utf-8')
+            return pipe_graphviz(self.command, output_format, lambda stdin: stdin.write(data), timeout)[0]
+        sessions = self.sessions.__dict__
+        session = sessions.get(output_format)
+        if session is None or not session.alive:
+            session = sessions[output_format] = GraphvizSession(self.command, output_format)
+        data = session.render(dot_code, timeout)
+        if session.jobs >= self.max_jobs or session.rss() > self.max_rss:
+            session.close()
+        return data
+
+class CircuitBreaker:
+    """Stops calls to a failing service: after `failures` consecutive
+    failures it opens and refuses calls for `reset_after` seconds, then lets
+    one trial call through (half-open) and closes again if that succeeds."""
+
+    def __init__(self, failures=3, reset_after=30.0):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.failed = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_after:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        """Whether a call may go ahead now; in the half-open state only the
+        first caller gets the trial call."""
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failed = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failed += 1
+            if self.trial or self.failed >= self.failures:
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+    def release(self):
+        """Ends a call that said nothing about the service's health: the
+        state is kept, and a half-open breaker lets the next call try."""
+        with self.lock:
+            self.trial = False
+
+class RemoteClient:
+    """POSTs to one HTTP service over a shared keep-alive session.
+
+    At most `max_connections` requests are in flight; further callers wait
+    for a slot within their timeout. Server errors (5xx), rate limiting
+    (429), timeouts and connection failures are retried up to `retries`
+    times after a random wait of up to backoff * 2 ** attempt seconds (full
+    jitter, capped at `max_backoff`), as long as the caller's deadline
+    allows. A call that still fails counts against the circuit breaker;
+    while it is open, post() fails at once. Other 4xx responses and waiting
+    for a slot leave the breaker as it was.
+    """
+
+    RETRY_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+    def __init__(self, url, max_connections=8, retries=2, backoff=0.25, max_backoff=4.0, breaker=None):
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.attempts = 0  # requests ever sent, retries included
+
+    def post(self, payload, timeout):
+        """The response content for a JSON `payload`, within `timeout`
+        seconds. Raises RuntimeError on failure."""
+        unavailable = f"Service unavailable, not retrying for {self.breaker.reset_after:g} s"
+        if self.breaker.state == "open":
+            raise RuntimeError(unavailable)
+        deadline = time.monotonic() + timeout
+        # Waiting for a slot is load on this side, not a failure of the
+        # service, so it is not reported to the breaker
+        if not self.slots.acquire(timeout=timeout):
+            raise RuntimeError(f"No free connection within {timeout} s")
+        try:
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"No free connection within {timeout} s")
+            if not self.breaker.allow():
+                raise RuntimeError(unavailable)
+            try:
+                content = self._post(payload, deadline)
+            except _RequestRejected:
+                self.breaker.release()
+                raise
+            except RuntimeError:
+                self.breaker.failure()
+                raise
+        finally:
+            self.slots.release()
+        self.breaker.success()
+        return content
+
+    def _post(self, payload, deadline):
+        attempt = 0
+        while True:
+            self.attempts += 1
+            try:
+                resp = self.session.post(self.url, json=payload, timeout=max(deadline - time.monotonic(), 0.01))
+            except self.RETRY_ERRORS as e:
+                error = f"{type(e).__name__}: {e}"
+            except requests.RequestException as e:
+                raise RuntimeError(f"{type(e).__name__}: {e}") from e
+            else:
+                if resp.status_code == 200:
+                    return resp.content
+                if resp.status_code < 500 and resp.status_code != 429:
+                    raise _RequestRejected(f"Service returned status {resp.status_code}")
+                error = f"Service returned status {resp.status_code}"
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            attempt += 1
+            if attempt > self.retries or time.monotonic() + delay >= deadline:
+                raise RuntimeError(error)
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+class _RequestRejected(RuntimeError):
+    # A 4xx other than 429: the request was bad, which says nothing about
+    # the service
+    pass
+
+class QuickChartRenderer(Renderer):
+    """The quickchart.io Graphviz service. Unavailable while its circuit
+    breaker is open, so a FallbackRenderer moves on without waiting."""
+    name = "quickchart.io"
+
+    def __init__(self, url=QUICKCHART_URL, client=None, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self.client = client or RemoteClient(url)
+
+    def available(self):
+        return self.client.breaker.state != "open"
+
+    def supports(self, output_format):
+        return output_format in ("svg", "png")
+
+    def _render(self, dot_code, output_format, timeout):
+        return self.client.post({"graph": dot_code, "format": output_format}, timeout)
+
+class FallbackRenderer(Renderer):
+    """Tries `backends` in order, skipping unavailable ones, and returns the
+    first successful render. Failed attempts are kept in its history too."""
+    name = "auto"
+
+    def __init__(self, backends, **kwargs):
+        super().__init__(**kwargs)
+        self.backends = list(backends)
+
+    def available(self):
+        return any(backend.available() for backend in self.backends)
+
+    def supports(self, output_format):
+        return any(backend.available() and backend.supports(output_format) for backend in self.backends)
+
+    def render(self, dot_code, output_format="svg", timeout=None):
+        errors = []
+        for backend in self.backends:
+            if not backend.available() or not backend.supports(output_format):
+                continue
+            try:
+                result = backend.render(dot_code, output_format, timeout)
+            except RuntimeError as e:
+                errors.append(str(e))
+                self.record(backend.history[-1])
+                continue
+            self.record(backend.history[-1])
+            return result
+        raise RuntimeError("; ".join(errors) or "No renderer available")
+
+class LayoutPool(Renderer):
+    """Runs `backend`'s renders on `workers` long-lived threads.
+
+    Jobs wait in a queue of at most `queue_size`; when it is full, render()
+    waits up to `wait` seconds for room and then fails fast (backpressure)
+    instead of piling up work. Each job has a deadline `timeout` seconds
+    after it was submitted, covering its time in the queue; a job whose
+    deadline passes while queued is dropped unrun. History and render
+    counts are the backend's.
+    """
+
+    def __init__(self, backend, workers=2, queue_size=8, wait=1.0, timeout=RENDER_TIMEOUT):
+        self.timeout = timeout
+        self.backend = backend
+        self.workers = workers
+        self.wait = wait
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.threads = []
+        self.lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.backend.name
+
+    @property
+    def history(self):
+        return self.backend.history
+
+    @property
+    def renders(self):
+        return self.backend.renders
+
+    def record(self, entry):
+        self.backend.record(entry)
+
+    def available(self):
+        return self.backend.available()
+
+    def supports(self, output_format):
+        return self.backend.supports(output_format)
+
+    def render(self, dot_code, output_format="svg", timeout=None):
+        self._start()
+        timeout = timeout or self.timeout
+        job = _Job(dot_code, output_format, time.monotonic() + timeout)
+        try:
+            self.jobs.put(job, timeout=self.wait)
+        except queue.Full:
+            self.record(RenderRecord(self.name, output_format, 0.0, "Layout queue full"))
+            raise RuntimeError(f"Layout queue full ({self.jobs.maxsize} jobs waiting), try again shortly")
+        if not job.done.wait(timeout):
+            job.cancelled = True
+            self.record(RenderRecord(self.name, output_format, timeout, "Deadline passed"))
+            raise RuntimeError(f"No layout within {timeout} s")
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _start(self):
+        with self.lock:
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self._work, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            remaining = job.deadline - time.monotonic()
+            if job.cancelled or remaining <= 0:
+                job.error = RuntimeError("Deadline passed while queued")
+            else:
+                try:
+                    job.result = self.backend.render(job.dot_code, job.output_format, remaining)
+                except RuntimeError as e:
+                    job.error = e
+            job.done.set()
+
+class _Job:
+    __slots__ = ('dot_code', 'output_format', 'deadline', 'done', 'cancelled', 'result', 'error')
+
+    def __init__(self, dot_code, output_format, deadline):
+        self.dot_code = dot_code
+        self.output_format = output_format
+        self.deadline = deadline
+        self.done = threading.Event()
+        self.cancelled = False
+        self.result = None
+        self.error = None
+
+_LAYOUT_ATTR_RE = re.compile(r'\blayout="?\w+"?')
+
+def with_graph_attrs(dot_code, attrs):
+    """DOT text with a `graph [attrs]` statement added at the top of the graph."""
+    start = dot_code.index('{') + 1
+    return f"{dot_code[:start]}\n  graph [{attrs}];{dot_code[start:]}"
+
+class LayoutResult:
+    """One DOT graph, laid out once; each image format is drawn from that
+    layout the first time it is asked for and then kept.
+
+    When the renderer can output DOT (local Graphviz), the layout is
+    Graphviz's positioned DOT with its engine switched to `nop2`, so
+    drawing a format reuses the node positions and edge routes instead of
+    laying the graph out again. With a warm LocalRenderer behind a
+    LayoutPool, the layout and the drawings all run in the workers' running
+    Graphviz processes. Otherwise every format is a render of the original
+    DOT, still made only on request; so is any format asked for while the
+    layout fails, and the layout is tried again for the next one.
+
+    With a `cache` (a DiskCache), the layout and every output are stored
+    under the DOT's digest and looked up there before rendering. Pass
+    `digest` when the DOT's md5 hexdigest is already known.
+    """
+
+    def __init__(self, renderer, dot_code, cache=None, digest=None):
+        self.renderer = renderer
+        self.dot_code = dot_code
+        self.cache = cache
+        self.digest = digest or hashlib.md5(dot_code.encode('utf-8')).hexdigest()
+        self.positioned = None
+        self.outputs = {}
+        self.lock = threading.Lock()
+
+    def supports(self, output_format):
+        return self.renderer.supports(output_format)
+
+    def output(self, output_format="svg", dpi=None):
+        """Image bytes in `output_format`, at `dpi` for raster formats.
+        Raises RuntimeError if it cannot be rendered."""
+        key = (output_format, dpi)
+        with self.lock:
+            data = self.outputs.get(key)
+            if data is None:
+                data = self._cached(cache_key(self.digest, output_format, dpi), self._draw, output_format, dpi)
+                self.outputs[key] = data
+        return data
+
+    def _cached(self, key, fn, *args):
+        if self.cache is None:
+            return fn(*args)
+        data = self.cache.get(key)
+        if data is None:
+            data = self.cache.put(key, fn(*args))
+        return data
+
+    def _layout(self):
+        # The positioned DOT, or None if the renderer cannot output DOT or
+        # the layout failed; a failed layout is tried again on the next call
+        if self.positioned is None and self.renderer.supports("dot"):
+            try:
+                laid_out = self._cached(cache_key(self.digest, "dot"), lambda: self.renderer.render(self.dot_code, "dot").data)
+            except RuntimeError:
+                return None
+            laid_out = laid_out.decode('utf-8')
+            positioned, found = _LAYOUT_ATTR_RE.subn('layout=nop2', laid_out, count=1)
+            self.positioned = positioned if found else with_graph_attrs(laid_out, 'layout=nop2')
+        return self.positioned
+
+    def _draw(self, output_format, dpi):
+        attrs = f"dpi={dpi}" if dpi else None
+        positioned = self._layout()
+        if positioned is not None:
+            try:
+                return self.renderer.render(with_graph_attrs(positioned, attrs) if attrs else positioned,
+                                            output_format).data
+            except RuntimeError:
+                pass  # draw from the original DOT instead
+        return self.renderer.render(with_graph_attrs(self.dot_code, attrs) if attrs else self.dot_code,
+                                    output_format).data
+
+def make_renderer(backend="auto", timeout=RENDER_TIMEOUT, warm=False):
+    """A renderer for one of BACKENDS; "auto" prefers local Graphviz and
+    falls back to quickchart.io. warm=True keeps local Graphviz processes
+    running between renders (see LayoutPool)."""
+    if backend == "local":
+        return LocalRenderer(warm=warm, timeout=timeout)
+    if backend == "quickchart":
+        return QuickChartRenderer(timeout=timeout)
+    if backend == "auto":
+        return FallbackRenderer([LocalRenderer(warm=warm, timeout=timeout), QuickChartRenderer(timeout=timeout)],
+                                timeout=timeout)
+    raise ValueError(f"Unknown renderer: {backend}")
@@ -0,0 +1,183 @@
+from types import MappingProxyType
+
+from diagram_keywords import classify_label
+
+# --- Advanced Theming System ---
+
+THEMES = {
+    "Professional (Blue)": {
+        "bgcolor": "#ffffff",
+        "edge_color": "#555555",
+        "font": "Helvetica",
+        "default": {"shape": "box", "style": "rounded,filled", "fill": "#e6f3ff", "border": "#336699", "text": "#000000"},
+        "types": {
+            "database": {"shape": "cylinder", "fill": "#fff3cd", "border": "#856404", "text": "#000000"},
+            "api": {"shape": "component", "fill": "#d1e7dd", "border": "#0f5132", "text": "#000000"},
+            "error": {"shape": "box", "style": "filled,dashed", "fill": "#f8d7da", "border": "#842029", "text": "#000000"},
+            "ui": {"shape": "rect", "fill": "#cff4fc", "border": "#055160", "text": "#000000"},
+            "actor": {"shape": "ellipse", "fill": "#e2e3e5", "border": "#383d41", "text": "#000000"}
+        }
+    },
+    "Whiteboard Sketch": {
+        "bgcolor": "#ffffff",
+        "edge_color": "#333333",
+        "font": "Comic Sans MS",
+        "default": {"shape": "box", "style": "dashed", "fill": "#ffffff", "border": "#333333", "text": "#333333"},
+        "types": {
+            "database": {"shape": "cylinder", "fill": "#ffffff", "border": "#333333", "text": "#333333"},
+            "api": {"shape": "component", "fill": "#ffffff", "border": "#333333", "text": "#333333"},
+            "error": {"shape": "box", "style": "dotted", "fill": "#ffffff", "border": "#ff0000", "text": "#ff0000"},
+            "ui": {"shape": "rect", "fill": "#ffffff", "border": "#0000ff", "text": "#0000ff"},
+            "actor": {"shape": "ellipse", "fill": "#ffffff", "border": "#333333", "text": "#333333"}
+        }
+    },
+    "Neon Cyberpunk": {
+        "bgcolor": "#0b0f19",
+        "edge_color": "#00f3ff",
+        "font": "Courier",
+        "default": {"shape": "polygon", "style": "filled", "fill": "#1a1f2e", "border": "#00f3ff", "text": "#e0e0e0"},
+        "types": {
+            "database": {"shape": "cylinder", "fill": "#2d1b2e", "border": "#ff0055", "text": "#ff0055"},
+            "api": {"shape": "component", "fill": "#0d2b2a", "border": "#00ff99", "text": "#00ff99"},
+            "error": {"shape": "box", "style": "dashed", "fill": "#2a0e0e", "border": "#ff3333", "text": "#ff3333"},
+            "ui": {"shape": "parallelogram", "fill": "#1a2a3a", "border": "#00aaff", "text": "#00aaff"},
+            "actor": {"shape": "diamond", "fill": "#222222", "border": "#ffff00", "text": "#ffff00"}
+        }
+    },
+    "Blueprint": {
+        "bgcolor": "#1c3b70",
+        "edge_color": "#ffffff",
+        "font": "Consolas",
+        "default": {"shape": "box", "style": "filled", "fill": "#1c3b70", "border": "#ffffff", "text": "#ffffff"},
+        "types": {
+            "database": {"shape": "cylinder", "fill": "#1c3b70", "border": "#ffffff", "text": "#ffffff"},
+            "api": {"shape": "component", "fill": "#1c3b70", "border": "#ffffff", "text": "#ffffff"},
+            "error": {"shape": "box", "style": "dashed", "fill": "#1c3b70", "border": "#ff6b6b", "text": "#ff6b6b"},
+            "ui": {"shape": "rect", "fill": "#1c3b70", "border": "#ffffff", "text": "#ffffff"},
+            "actor": {"shape": "ellipse", "fill": "#1c3b70", "border": "#ffffff", "text": "#ffffff"}
+        }
+    },
+    "Minimalist": {
+        "bgcolor": "#fafafa",
+        "edge_color": "#cccccc",
+        "font": "Arial",
+        "default": {"shape": "box", "style": "rounded", "fill": "#ffffff", "border": "#333333", "text": "#333333"},
+        "types": {
+            "database": {"shape": "cylinder", "fill": "#ffffff", "border": "#666666", "text": "#333333"},
+            "api": {"shape": "component", "fill": "#ffffff", "border": "#666666", "text": "#333333"},
+            "error": {"shape": "box", "style": "dashed", "fill": "#ffffff", "border": "#cc0000", "text": "#cc0000"},
+            "ui": {"shape": "rect", "fill": "#ffffff", "border": "#666666", "text": "#333333"},
+            "actor": {"shape": "ellipse", "fill": "#ffffff", "border": "#666666", "text": "#333333"}
+        }
+    },
+    "Vibrant": {
+        "bgcolor": "#ffffff",
+        "edge_color": "#333333",
+        "font": "Verdana",
+        "default": {"shape": "box", "style": "rounded,filled", "fill": "#e8f4f8", "border": "#2c5aa0", "text": "#1a1a1a"},
+        "types": {
+            "database": {"shape": "cylinder", "fill": "#fff4e6", "border": "#ff8c00", "text": "#1a1a1a"},
+            "api": {"shape": "component", "fill": "#e8f5e9", "border": "#4caf50", "text": "#1a1a1a"},
+            "error": {"shape": "box", "style": "filled,dashed", "fill": "#ffebee", "border": "#f44336", "text": "#1a1a1a"},
+            "ui": {"shape": "rect", "fill": "#f3e5f5", "border": "#9c27b0", "text": "#1a1a1a"},
+            "actor": {"shape": "ellipse", "fill": "#e1f5fe", "border": "#03a9f4", "text": "#1a1a1a"}
+        }
+    }
+}
+
+NODE_TYPES = ("database", "api", "error", "ui", "actor", "default")
+VISUALIZATION_MODES = ("flow", "sequence", "mindmap", "network")
+
+_THEME_KEYS = {"bgcolor", "edge_color", "font", "default", "types"}
+_STYLE_KEYS = {"shape", "style", "fill", "border", "text"}
+_REQUIRED_STYLE_KEYS = {"shape", "fill", "border", "text"}
+
+def validate_theme(name, theme):
+    """Raises ValueError naming the first problem with a THEMES entry."""
+    if not isinstance(theme, dict):
+        raise ValueError(f"Theme '{name}' must be a dict")
+    missing = _THEME_KEYS - theme.keys()
+    if missing:
+        raise ValueError(f"Theme '{name}' is missing {', '.join(sorted(missing))}")
+    for key in ("bgcolor", "edge_color", "font"):
+        if not isinstance(theme[key], str):
+            raise ValueError(f"Theme '{name}': {key} must be a string")
+    styles = [("default", theme["default"])]
+    if not isinstance(theme["types"], dict):
+        raise ValueError(f"Theme '{name}': types must be a dict")
+    for node_type, style in theme["types"].items():
+        if node_type not in NODE_TYPES:
+            raise ValueError(f"Theme '{name}': unknown node type '{node_type}'")
+        styles.append((f"types.{node_type}", style))
+    for where, style in styles:
+        if not isinstance(style, dict):
+            raise ValueError(f"Theme '{name}': {where} must be a dict")
+        unknown = style.keys() - _STYLE_KEYS
+        if unknown:
+            raise ValueError(f"Theme '{name}': {where} has unknown key(s) {', '.join(sorted(unknown))}")
+        if not all(isinstance(v, str) for v in style.values()):
+            raise ValueError(f"Theme '{name}': {where} values must be strings")
+    missing = _REQUIRED_STYLE_KEYS - theme["default"].keys()
+    if missing:
+        raise ValueError(f"Theme '{name}': default is missing {', '.join(sorted(missing))}")
+
+def _graphviz_attrs(theme, node_type, visualization_mode):
+    s = dict(theme["default"])
+    s.update(theme["types"].get(node_type, theme["default"]))
+
+    # Enhanced styling based on visualization mode
+    if visualization_mode == "mindmap":
+        # Use more organic shapes for mind maps
+        shape = "ellipse" if node_type == "default" else s["shape"]
+        style = f'style="{s.get("style", "filled")},rounded"'
+    elif visualization_mode == "sequence":
+        # Use boxes for sequence diagrams
+        shape = "box"
+        style = f'style="{s.get("style", "filled")},rounded"'
+    elif visualization_mode == "network":
+        # Use varied shapes for network diagrams
+        shape = s["shape"]
+        style = f'style="{s.get("style", "filled")},rounded"'
+    else:
+        shape = s["shape"]
+        style = f'style="{s.get("style", "filled")}"'
+
+    return f'shape="{shape}", {style}, fillcolor="{s["fill"]}", color="{s["border"]}", fontcolor="{s["text"]}"'
+
+def compile_graphviz_styles(themes):
+    """Validates `themes` and returns {(theme, mode): {node_type: DOT attributes}},
+    read-only at both levels."""
+    table = {}
+    for name, theme in themes.items():
+        validate_theme(name, theme)
+        for mode in VISUALIZATION_MODES:
+            row = {t: _graphviz_attrs(theme, t, mode) for t in NODE_TYPES}
+            table[(name, mode)] = MappingProxyType(row)
+    return MappingProxyType(table)
+
+GRAPHVIZ_STYLES = compile_graphviz_styles(THEMES)
+
+DRAWIO_STYLES = MappingProxyType({
+    "database": "shape=cylinder3;whiteSpace=wrap;html=1;boundedLbl=1;backgroundOutline=1;size=15;fillColor=#fff2cc;strokeColor=#d6b656;",
+    "api": "shape=component;align=left;spacingLeft=36;fillColor=#d5e8d4;strokeColor=#82b366;",
+    "error": "rounded=1;whiteSpace=wrap;html=1;fillColor=#f8cecc;strokeColor=#b85450;dashed=1;",
+    "actor": "shape=ellipse;fillColor=#dae8fc;strokeColor=#6c8ebf;",
+    "ui": "rounded=1;whiteSpace=wrap;html=1;fillColor=#e1d5e7;strokeColor=#9673a6;",
+    "default": "rounded=1;whiteSpace=wrap;html=1;absoluteArcSize=1;arcSize=14;strokeWidth=2;fillColor=#f5f5f5;strokeColor=#666666;fontColor=#333333;",
+})
+
+def get_node_type(label):
+    return classify_label(label)[1]
+
+def graphviz_style_row(theme_name, visualization_mode="flow"):
+    """{node_type: DOT attributes} for a theme and mode (unknown modes style like "flow")."""
+    row = GRAPHVIZ_STYLES.get((theme_name, visualization_mode))
+    if row is None:
+        row = GRAPHVIZ_STYLES[(theme_name, "flow")]
+    return row
+
+def get_graphviz_style(label, theme_name, visualization_mode="flow"):
+    return graphviz_style_row(theme_name, visualization_mode)[get_node_type(label)]
+
+def get_drawio_style(label):
+    return DRAWIO_STYLES[get_node_type(label)]
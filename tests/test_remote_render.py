@@ -0,0 +1,63 @@
+"""RemoteClient against the local stub service from bench_remote_render:
+429 responses and the circuit breaker.
+
+Run from the repository root:  python -m pytest tests
+"""
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+import pytest
+
+from bench_remote_render import DOT, SVG, Stub
+from diagram_render import CircuitBreaker, RemoteClient
+
+def test_429_is_retried():
+    with Stub(fail_first=2, fail_status=429) as stub:
+        client = RemoteClient(stub.url, retries=2, backoff=0.01)
+        assert client.post({"graph": DOT}, 5) == SVG
+        assert client.attempts == 3 and client.breaker.failed == 0
+
+def test_429_after_the_last_retry_counts_as_a_failure():
+    with Stub(fail_every=1, fail_status=429) as stub:
+        client = RemoteClient(stub.url, retries=2, backoff=0.01, breaker=CircuitBreaker(failures=2))
+        with pytest.raises(RuntimeError, match="429"):
+            client.post({"graph": DOT}, 5)
+        assert client.attempts == 3 and client.breaker.failed == 1
+        with pytest.raises(RuntimeError, match="429"):
+            client.post({"graph": DOT}, 5)
+        assert client.breaker.state == "open"
+
+def test_4xx_leaves_a_closed_breaker_alone():
+    with Stub(fail_every=1, fail_status=500) as stub:
+        client = RemoteClient(stub.url, retries=0, breaker=CircuitBreaker(failures=2))
+        with pytest.raises(RuntimeError, match="500"):
+            client.post({"graph": DOT}, 5)
+        stub.fail_status = 400
+        with pytest.raises(RuntimeError, match="400"):
+            client.post({"graph": DOT}, 5)
+        assert client.attempts == 2
+        assert client.breaker.state == "closed" and client.breaker.failed == 1
+
+def test_4xx_during_half_open_keeps_the_breaker_half_open():
+    with Stub(fail_every=1, fail_status=500) as stub:
+        client = RemoteClient(stub.url, retries=0, breaker=CircuitBreaker(failures=1, reset_after=0.2))
+        with pytest.raises(RuntimeError, match="500"):
+            client.post({"graph": DOT}, 5)
+        assert client.breaker.state == "open"
+        time.sleep(0.25)
+
+        # The trial call is rejected: neither closed nor opened again, and
+        # the next call gets the trial
+        stub.fail_status = 400
+        with pytest.raises(RuntimeError, match="400"):
+            client.post({"graph": DOT}, 5)
+        assert client.breaker.state == "half-open" and client.breaker.failed == 1
+
+        stub.fail_every = 0
+        assert client.post({"graph": DOT}, 5) == SVG
+        assert client.breaker.state == "closed" and client.breaker.failed == 0
+        assert client.attempts == 3